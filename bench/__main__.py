@@ -0,0 +1,201 @@
+import io
+import os
+import json
+import argparse
+import tempfile
+import contextlib
+
+from bench.generate import generate
+from instr_gen import counts, parallel
+from instr_gen.cache import load_measurements
+from instr_gen.config import Config
+from instr_gen.parser import parse
+from instr_gen.profiling import measure
+from instr_gen.result import Result
+from instr_gen.writer import atomic_open
+
+
+# Returns parser args
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description = 'Benchmark instr_gen on synthetic inputs of several sizes'
+    )
+
+    parser.add_argument('--sizes',
+        type = str,
+        action = 'store',
+        default = '1000,5000,20000',
+        help = 'Comma separated numbers of instructions'
+    )
+    parser.add_argument('--archs',
+        type = int,
+        action = 'store',
+        default = 3,
+        help = 'Number of architectures in the xml'
+    )
+    parser.add_argument('--ports',
+        type = int,
+        action = 'store',
+        default = 10,
+        help = 'Number of ports (the first two are load and store)'
+    )
+    parser.add_argument('--latencies',
+        type = int,
+        action = 'store',
+        default = 40,
+        help = 'Number of distinct latency values'
+    )
+    parser.add_argument('--bench-files',
+        type = int,
+        action = 'store',
+        default = 8,
+        help = 'Number of benchmark count files'
+    )
+    parser.add_argument('--num-uops',
+        type = int,
+        action = 'store',
+        default = 20,
+        help = 'num_uops of the group_rep_port group'
+    )
+    parser.add_argument('--jobs',
+        type = int,
+        action = 'store',
+        default = 1,
+        help = 'Number of worker processes used by stages (default: 1)'
+    )
+    parser.add_argument('--seed',
+        type = int,
+        action = 'store',
+        default = 0,
+        help = 'Seed of the generator'
+    )
+    parser.add_argument('--output',
+        type = str,
+        action = 'store',
+        default = '',
+        help = 'JSON file to write results to'
+    )
+
+    args = parser.parse_args()
+    args.sizes = [ int(i) for i in args.sizes.split(',') ]
+
+    return args
+
+
+
+# Runs the stages of the pipeline on generated inputs, each stage is
+# measured separately (stdout of the pipeline is discarded)
+class Benchmark:
+    def __init__(self, paths: dict, work_dir: str, num_instructions: int):
+        self.paths = paths
+        self.work_dir = work_dir
+        self.num_instructions = num_instructions
+        self.stages = []
+
+
+    # Measures block as stage name, items are processed by the stage
+    @contextlib.contextmanager
+    def stage(self, name: str, items: int):
+        stats = { 'size': self.num_instructions, 'stage': name, 'items': items }
+
+        with contextlib.redirect_stdout(io.StringIO()), measure(stats):
+            yield
+
+        stats['throughput'] = items / stats['wall'] if stats['wall'] > 0 else 0
+        self.stages.append(stats)
+
+
+    def _config(self, icode_mapping: dict = None) -> Config:
+        return Config(self.paths['configs'][0], self.paths['icode'], icode_mapping)
+
+
+    def run(self, num_uops: int) -> list:
+        mapping = self._config().icode_mapping
+
+        config = self._config(mapping)
+        with self.stage('parser.parse', self.num_instructions):
+            parse(self.paths['xml'], config)
+
+        # Measurements cache is built first, then measured when loaded
+        cache_dir = os.path.join(self.work_dir, 'cache')
+        load_measurements(self.paths['xml'], cache_dir, [ config.arch ], False)
+
+        cached = self._config(mapping)
+        with self.stage('parser.parse (cached)', self.num_instructions):
+            table = load_measurements(self.paths['xml'], cache_dir,
+                                      [ cached.arch ], False)
+            parse(self.paths['xml'], cached, table)
+
+        vec, base = config.instr_groups
+        rep_port = vec.algorithm
+
+        # Counts are read from benchmark files (no cache)
+        counts.store = counts.CountsStore()
+        num_files = len(os.listdir(self.paths['counts']))
+        with self.stage('GroupRepPort._setup_counts', num_files):
+            rep_port._setup_counts()
+
+        vec.instructions.sort(key = lambda x: x.icode)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rep_port._setup(vec.instructions)
+            K = rep_port._num_uops(num_uops, verbose = False)
+
+        with self.stage('GroupRepPort.Solver.solve', len(vec.instructions)):
+            ans = rep_port.Solver(rep_port.instr_dict).solve(K)
+
+        result = Result()
+        result.merge(rep_port._build_result(ans))
+
+        base.instructions.sort(key = lambda x: x.icode)
+        with self.stage('DirectBinary.solve', len(base.instructions)):
+            result.merge(base.algorithm.solve(base.instructions))
+
+        name = os.path.join(self.work_dir, 'out')
+        with self.stage('Result.output', len(result.instructions)):
+            result.output(name)
+
+        return self.stages
+
+
+# Prints table of results
+def print_results(stages: list) -> None:
+    print(f'{"size":>8}  {"stage":<36}{"wall (s)":>10}{"cpu (s)":>10}'
+          f'{"peak (MiB)":>12}{"items/s":>12}')
+
+    for i in stages:
+        print(f'{i["size"]:>8}  {i["stage"]:<36}{i["wall"]:>10.4f}{i["cpu"]:>10.4f}'
+              f'{i["peak_traced"] / 2**20:>12.2f}{i["throughput"]:>12.0f}')
+
+
+#####################
+def main() -> int:
+    args = parse_args()
+    parallel.jobs = args.jobs
+
+    stages = []
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            paths = generate(os.path.join(work_dir, 'input'),
+                num_instructions = size,
+                num_archs = args.archs,
+                num_ports = args.ports,
+                num_latencies = args.latencies,
+                num_bench_files = args.bench_files,
+                num_uops = args.num_uops,
+                seed = args.seed
+            )
+
+            stages += Benchmark(paths, work_dir, size).run(args.num_uops)
+
+    print_results(stages)
+
+    if args.output != '':
+        with atomic_open(args.output) as f:
+            json.dump({ 'args': vars(args), 'stages': stages }, f, indent = 2)
+            f.write('\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
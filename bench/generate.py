@@ -0,0 +1,227 @@
+import os
+import random
+
+# Extensions of each instruction group of the generated config
+VEC_EXTENSIONS  = [ 'SSE', 'SSE2', 'AVX', 'AVX2', 'FMA' ]
+BASE_EXTENSIONS = [ 'BASE', 'BMI1' ]
+
+# Mnemonics of generated instructions (some of them match FU samples)
+MNEMONICS = [ 'VPADDSW', 'VADDPS', 'PSLLVD', 'PMULLD', 'VPMADDWD', 'XORPS',
+              'SHUFPS', 'MOVAPS', 'ANDN', 'BLSR', 'LEA', 'IMUL' ]
+
+OPERANDS = [ 'XMM', 'YMM', 'M128', 'M256', 'R32', 'R64', 'I8' ]
+
+
+# Returns names of ports, the first two are the load and store ports
+def port_names(num_ports: int) -> list:
+    return [ f'p{i}' for i in range(num_ports) ]
+
+
+# Returns names of architectures
+def arch_names(num_archs: int) -> list:
+    return [ f'ARCH{i}' for i in range(num_archs) ]
+
+
+# Writes uops.info-like instructions.xml and icode mapping of the generated
+# instructions (every instruction is measured on every architecture)
+def _write_instructions(out_dir: str, rng: random.Random, num_instructions: int,
+                        archs: list, ports: list, num_latencies: int) -> list:
+    icodes = []
+    extensions = VEC_EXTENSIONS + BASE_EXTENSIONS
+    compute = ports[2:]
+
+    xml = open(os.path.join(out_dir, 'instructions.xml'), 'w')
+    mapping = open(os.path.join(out_dir, 'icode_mapping.cfg'), 'w')
+
+    xml.write('<?xml version="1.0"?>\n<root>\n')
+    mapping.write('instructions = (\n')
+
+    for i in range(num_instructions):
+        ext = rng.choice(extensions)
+        mnemonic = rng.choice(MNEMONICS)
+        operands = rng.sample(OPERANDS, rng.randint(0, 3))
+
+        name = f'{mnemonic}{i}'
+        if len(operands) > 0:
+            name += ' (' + ', '.join(operands) + ')'
+
+        icode = f'{mnemonic}_{i}'
+        icodes.append(icode)
+
+        xml.write(f'<extension name="{ext}">\n'
+                  f'<instruction asm="{mnemonic}" string="{name}" '
+                  f'iform="{icode}" extension="{ext}" isa-set="{ext}">\n')
+
+        for arch in archs:
+            used = rng.sample(compute, rng.randint(1, min(3, len(compute))))
+            if rng.random() < 0.3:
+                used.append(ports[0])
+            if rng.random() < 0.1:
+                used.append(ports[1])
+
+            usage = [ (rng.randint(1, 2), p) for p in used ]
+            num_uops = sum(n for n, _ in usage)
+            ports_str = '+'.join(f'{n}*{p}' for n, p in usage)
+
+            xml.write(f'<architecture name="{arch}">\n'
+                      f'<measurement TP="1.00" ports="{ports_str}" uops="{num_uops}">\n')
+
+            for _ in range(rng.randint(1, 2)):
+                lat = rng.randint(1, num_latencies)
+                xml.write(f'<latency start_op="1" target_op="2" cycles="{lat}"/>\n')
+
+            xml.write('</measurement>\n</architecture>\n')
+
+        xml.write('</instruction>\n</extension>\n')
+
+        sep = ',\n' if i > 0 else ''
+        mapping.write(f'{sep}\t{{ instr = "{name}"; icode = "{icode}"; }}')
+
+    xml.write('</root>\n')
+    mapping.write('\n);\n')
+
+    xml.close()
+    mapping.close()
+
+    return icodes
+
+
+# Writes benchmark files (icode, count) with a random subset of icodes each
+def _write_counts(out_dir: str, rng: random.Random, icodes: list,
+                  num_files: int) -> str:
+    counts_dir = os.path.join(out_dir, 'counts')
+    os.makedirs(counts_dir, exist_ok = True)
+
+    for b in range(num_files):
+        with open(os.path.join(counts_dir, f'bench{b}.csv'), 'w') as f:
+            f.write('icode,count\n')
+            for icode in rng.sample(icodes, max(1, len(icodes) // 2)):
+                f.write(f'{icode},{rng.randint(1, 10**7)}\n')
+
+    return counts_dir
+
+
+# Writes config of architecture with a group_rep_port group (vectorial
+# extensions) and a direct_binary group (base extensions)
+def _write_config(path: str, arch: str, ports: list, counts_dir: str,
+                  num_uops: int) -> None:
+    compute = ports[2:]
+    uops = dict((p, f'U{p[1:]}') for p in compute)
+
+    # The uop of the first compute port has several FUs (samples decide)
+    fus = dict((u, [ f'FU{u[1:]}' ]) for u in uops.values())
+    fus[uops[compute[0]]] += [ 'Vec_Add', 'Vec_Mul' ]
+
+    fu_names = sorted(set(f for v in fus.values() for f in v))
+
+    port_list = ', '.join(f'"{p}"' for p in ports)
+    port_to_uop = ''.join(
+        f'\t\t\t{p}: "{uops.get(p, "")}";\n' for p in ports
+    )
+    uop_to_fu = ''.join(
+        f'\t\t\t{u}: [' + ', '.join(f'"{f}"' for f in v) + '];\n'
+        for u, v in fus.items()
+    )
+    uop_latency = ''.join(f'\t\t\t\t{u}: 1;\n' for u in fus.keys())
+    functional_units = ',\n'.join(
+        f'\t{{ name = "{f}"; size = 2; wait_next = 1; }}' for f in fu_names
+    )
+
+    vec_exts = ', '.join(f'"{e}"' for e in VEC_EXTENSIONS)
+    base_exts = ', '.join(f'"{e}"' for e in BASE_EXTENSIONS)
+
+    with open(path, 'w') as f:
+        f.write(f'''arch = "{arch}";
+
+ports = [ {port_list} ];
+
+functional_units = (
+{functional_units}
+);
+
+instruction_groups = (
+\t{{
+\t\tname = "vec";
+\t\textensions = [ {vec_exts} ];
+\t\tneed_latency = True;
+
+\t\tport_to_uop = {{
+{port_to_uop}\t\t}};
+
+\t\tuop_to_fu = {{
+{uop_to_fu}\t\t}};
+
+\t\talgorithm: {{
+\t\t\ttype = "group_rep_port";
+\t\t\tcounts_path = "{counts_dir}";
+\t\t\tnum_uops = {num_uops};
+\t\t\tlatency_fix = (
+\t\t\t\t{{ label = "load";  port = "{ports[0]}"; lat = 4; operands = ({{ name = "YMM"; lat = 1; }}); }},
+\t\t\t\t{{ label = "store"; port = "{ports[1]}"; lat = 1; }}
+\t\t\t);
+\t\t\tsamples = (
+\t\t\t\t{{ fu = "Vec_Add"; instructions = [ "ADDP", "PADDS" ]; }},
+\t\t\t\t{{ fu = "Vec_Mul"; instructions = [ "MUL", "PMADD" ]; }}
+\t\t\t);
+\t\t}};
+\t}},
+\t{{
+\t\tname = "base";
+\t\textensions = [ {base_exts} ];
+\t\tneed_latency = False;
+
+\t\tport_to_uop = {{
+{port_to_uop}\t\t}};
+
+\t\tuop_to_fu = {{
+{uop_to_fu}\t\t}};
+
+\t\talgorithm: {{
+\t\t\ttype = "direct_binary";
+\t\t\tuop_latency = {{
+{uop_latency}\t\t\t}};
+\t\t\tport_fix = (
+\t\t\t\t{{ label = "load";  port = "{ports[0]}"; }},
+\t\t\t\t{{ label = "store"; port = "{ports[1]}"; }}
+\t\t\t);
+\t\t}};
+\t}}
+);
+''')
+
+
+# Generates synthetic inputs into out_dir: instructions.xml, icode mapping,
+# benchmark counts and a config for each architecture. Returns dict with
+# paths of xml, icode mapping, counts directory and configs
+def generate(out_dir: str,
+             num_instructions: int = 1000,
+             num_archs: int = 1,
+             num_ports: int = 8,
+             num_latencies: int = 30,
+             num_bench_files: int = 4,
+             num_uops: int = 20,
+             seed: int = 0) -> dict:
+    if num_ports < 3:
+        raise ValueError('at least 3 ports are needed (load, store, compute)')
+
+    os.makedirs(out_dir, exist_ok = True)
+    rng = random.Random(seed)
+
+    archs = arch_names(num_archs)
+    ports = port_names(num_ports)
+
+    icodes = _write_instructions(out_dir, rng, num_instructions,
+                                 archs, ports, num_latencies)
+    counts_dir = _write_counts(out_dir, rng, icodes, num_bench_files)
+
+    configs = []
+    for arch in archs:
+        configs.append(os.path.join(out_dir, f'config_{arch.lower()}.cfg'))
+        _write_config(configs[-1], arch, ports, counts_dir, num_uops)
+
+    return {
+        'xml': os.path.join(out_dir, 'instructions.xml'),
+        'icode': os.path.join(out_dir, 'icode_mapping.cfg'),
+        'counts': counts_dir,
+        'configs': configs
+    }
@@ -18,12 +18,12 @@ unsigned int ascii_to_hex(const char *src,
                           xed_uint8_t *dst,
                           unsigned int max_bytes)
 {
-    const unsigned int len = strlen(src);
+    const unsigned int len = std::min((unsigned int) strlen(src) / 2, max_bytes);
     memset(dst, 0, max_bytes);
 
-    for (unsigned int p = 0, i = 0; i < len / 2; ++i, p += 2)
+    for (unsigned int p = 0, i = 0; i < len; ++i, p += 2)
         dst[i] = (xed_uint8_t) (hex_to_dec(src[p]) * 16 + hex_to_dec(src[p+1]));
-    return len/2;
+    return len;
 }
 
 std::string get_operands(xed_decoded_inst_t *xedd) {
@@ -90,9 +90,25 @@ std::string get_operands(xed_decoded_inst_t *xedd) {
     return std::string(xed_iform_enum_t2str(xed_decoded_inst_get_iform_enum(xedd))) + result;
 }
 
+// Decodes one instruction given in hexadecimal, returns iform + operands
+std::string decode(const xed_state_t *dstate,
+                   xed_chip_enum_t chip,
+                   const std::string &hex)
+{
+    xed_decoded_inst_t xedd;
+
+    xed_decoded_inst_zero_set_mode(&xedd, dstate);
+    xed_decoded_inst_set_input_chip(&xedd, chip);
+
+    unsigned char itext[XED_MAX_INSTRUCTION_BYTES];
+    xed_uint_t bytes = ascii_to_hex(hex.c_str(), itext, XED_MAX_INSTRUCTION_BYTES);
+    xed_decode(&xedd, XED_REINTERPRET_CAST(const xed_uint8_t*, itext), bytes);
+
+    return get_operands(&xedd);
+}
+
 int main(int argc, char** argv) {
     xed_state_t dstate;
-    xed_decoded_inst_t xedd;
 
     xed_tables_init();
     xed_state_zero(&dstate);
@@ -102,6 +118,7 @@ int main(int argc, char** argv) {
 
     xed_uint_t first_argv = 1;
     xed_bool_t already_set_mode = 0;
+    xed_bool_t from_stdin = 0;
     xed_chip_enum_t chip = XED_CHIP_INVALID;
 
     xed_uint_t argcu = (xed_uint_t) argc;
@@ -127,20 +144,30 @@ int main(int argc, char** argv) {
             chip = str2xed_chip_enum_t(argv[i+1]);
             assert(chip != XED_CHIP_INVALID);
             first_argv+=2;
+        } else if (strcmp(argv[i], "-stdin") == 0) {
+            from_stdin = 1;
+            first_argv++;
         }
     }
 
-    assert(first_argv == argcu - 1);
+    // Streaming mode: tables are initialized once and every line read from
+    // stdin (one hexadecimal instruction) produces one line of output
+    if (from_stdin) {
+        assert(first_argv == argcu);
 
-    std::string hex(argv[first_argv]);
+        std::string hex;
+        while (std::getline(std::cin, hex)) {
+            if (hex.size() > 0 && hex[hex.size() - 1] == '\r')
+                hex.erase(hex.size() - 1);
+            std::cout << decode(&dstate, chip, hex) << std::endl;
+        }
 
-    xed_decoded_inst_zero_set_mode(&xedd, &dstate);
-    xed_decoded_inst_set_input_chip(&xedd, chip);
+        return 0;
+    }
 
-    unsigned char itext[XED_MAX_INSTRUCTION_BYTES];
-    xed_uint_t bytes = ascii_to_hex(hex.c_str(), itext, XED_MAX_INSTRUCTION_BYTES);
-    xed_decode(&xedd, XED_REINTERPRET_CAST(const xed_uint8_t*, itext), bytes);
+    assert(first_argv == argcu - 1);
 
-    std::cout << get_operands(&xedd) << std::endl;
+    std::string hex(argv[first_argv]);
+    std::cout << decode(&dstate, chip, hex) << std::endl;
     return 0;
 }
@@ -4,10 +4,15 @@
 # defined by intel's XED. The result is a .py file containing the dictionary
 # to be imported and used in a python code.
 
+import io
 import os
+import libconf
 import argparse
+import subprocess
 import xml.etree.ElementTree as ET
 
+from concurrent.futures import ThreadPoolExecutor
+
 
 # Returns parser args
 def parse_args() -> argparse.Namespace:
@@ -43,10 +48,73 @@ def parse_args() -> argparse.Namespace:
         required = True,
         help = 'Path decoder.'
     )
+    parser.add_argument('--jobs',
+        type = int,
+        action = 'store',
+        default = 0,
+        help = 'Number of decoder processes (default: one per core).'
+    )
+    parser.add_argument('--previous',
+        type = str,
+        action = 'store',
+        default = '',
+        help = 'Existing mapping, only missing instructions are decoded.'
+    )
 
     return parser.parse_args()
 
 
+# Decodes list of hexadecimal instructions into icodes, all of them are
+# piped through a single decoder process (streaming mode)
+def decode(decoder: str, hex_list: list) -> list:
+    if len(hex_list) == 0:
+        return []
+
+    command = [ decoder, '-64', '-chip', 'SKYLAKE', '-stdin' ]
+    proc = subprocess.Popen(command,
+        stdin = subprocess.PIPE,
+        stdout = subprocess.PIPE,
+        universal_newlines = True
+    )
+
+    out, _ = proc.communicate('\n'.join(hex_list) + '\n')
+    values = out.splitlines()
+
+    if proc.returncode != 0 or len(values) != len(hex_list):
+        raise RuntimeError(f'{decoder} failed ({len(values)} of '
+                           f'{len(hex_list)} instructions decoded)')
+
+    return values
+
+
+# Decodes hex_list using a pool of decoder processes, the list is split into
+# ordered shards and results are merged back in the original order
+def decode_parallel(decoder: str, hex_list: list, jobs: int) -> list:
+    if len(hex_list) == 0:
+        return []
+
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+
+    jobs = max(1, min(jobs, len(hex_list)))
+    size = (len(hex_list) + jobs - 1) // jobs
+    shards = [ hex_list[i:i + size] for i in range(0, len(hex_list), size) ]
+
+    # Threads only wait for decoder processes, which do the actual work
+    with ThreadPoolExecutor(jobs) as pool:
+        results = pool.map(lambda x: decode(decoder, x), shards)
+
+    return [ value for shard in results for value in shard ]
+
+
+# Loads existing mapping file (instruction string -> icode)
+def load_mapping(path: str) -> dict:
+    with io.open(path) as f:
+        data = libconf.load(f)
+
+    return dict((i['instr'], i['icode']) for i in data['instructions'])
+
+
 # Returns whether instruction is available on given architecture or not
 def check_if_available(instrNode, arch) -> bool:
     for archNode in instrNode.iter('architecture'):
@@ -55,10 +123,39 @@ def check_if_available(instrNode, arch) -> bool:
     return False
 
 
+# Assembles TMP_ordered_asm.S and returns icode of each instruction
+def get_icodes(decoder: str, jobs: int) -> list:
+    # In order to obtain icode the following steps must be done:
+    # 1. Assemble the .S file using gcc's assembler
+    os.system('gcc -c TMP_ordered_asm.S')
+
+    # 2. Use objdump to get hexadecimal from assembly
+    assembled = os.popen('objdump -z -M intel -d TMP_ordered_asm.o').readlines()
+    assembled = assembled[7:]
+    os.system('rm TMP_ordered_asm.o')
+
+    # 3. Fix hex (sometimes an instruction in broken into 2 lines)
+    hex_result, ihex = [], ''
+    for asm in reversed(assembled):
+        line = asm[:-1].split('\t')
+        ihex = line[1].replace(' ', '') + ihex
+        if len(line) == 3:
+            hex_result.append(ihex)
+            ihex = ''
+
+    # 4. Use xed to get icode from hexadecimal (hex_result is reversed)
+    return decode_parallel(decoder, hex_result[::-1], jobs)
+
+
 #####################
 def main() -> int:
     args = parse_args()
-    keys, values = [], []
+    keys, new_keys = [], []
+
+    # Incremental mode, instructions already mapped are not decoded again
+    previous = {}
+    if args.previous != '':
+        previous = load_mapping(args.previous)
 
     f_assembly = open('TMP_ordered_asm.S', 'w')
     root = ET.parse(args.xml)
@@ -93,6 +190,11 @@ def main() -> int:
         if not check_if_available(instrNode, args.arch):
             continue
 
+        # Resulting dict's keys are the instructions' strings
+        keys.append(instrNode.attrib['string'])
+        if keys[-1] in previous:
+            continue
+
         # Each instruction must contain valid operands in order to be
         # assembled properly, these operands types are retrived from
         # xml and renamed to real operands (i.e. registers, memory address)
@@ -186,46 +288,35 @@ def main() -> int:
         elif asm.startswith('{store}'):
             asm = asm.replace('{store}', '{load}')
 
-        # Resulting dict's keys are the instructions' strings
-        keys.append(instrNode.attrib['string'])
+        new_keys.append(instrNode.attrib['string'])
 
         # Writes to assembly (.S file)
         print(asm, file=f_assembly)
 
     f_assembly.close()
 
-    # In order to obtain icode the following steps must be done:
-    # 1. Assemble the .S file using gcc's assembler
-    os.system('gcc -c TMP_ordered_asm.S')
-    os.system('rm TMP_ordered_asm.S')
+    if args.previous != '':
+        print(f'{len(new_keys)} new instructions')
 
-    # 2. Use objdump to get hexadecimal from assembly
-    assembled = os.popen('objdump -z -M intel -d TMP_ordered_asm.o').readlines()
-    assembled = assembled[7:]
-    os.system('rm TMP_ordered_asm.o')
+    values = []
+    if len(new_keys) > 0:
+        values = get_icodes(args.decoder, args.jobs)
+    os.system('rm TMP_ordered_asm.S')
 
-    # 3. Fix hex (sometimes an instruction in broken into 2 lines)
-    hex_result, ihex = [], ''
-    for asm in reversed(assembled):
-        line = asm[:-1].split('\t')
-        ihex = line[1].replace(' ', '') + ihex
-        if len(line) == 3:
-            hex_result.append(ihex)
-            ihex = ''
+    # Instructions of previous mapping not in xml are kept
+    mapping = dict(previous)
+    mapping.update(zip(new_keys, values))
 
-    # 4. Use xed to get icode from hexadecimal
-    while len(hex_result) > 0:
-        input_hex = hex_result.pop()
-        command = f'{args.decoder} -64 -chip SKYLAKE {input_hex}'
-        result = os.popen(command).readlines()
-        values.append(result[0][:-1])
+    tracked = set(keys)
+    keys += [ k for k in previous.keys() if k not in tracked ]
 
     # 5. Generate file containing keys (string) -> values (icode)
     f_mapping = open(args.output, 'w')
     
     print('instructions = (', file = f_mapping)
     lines = []
-    for k, v in zip(keys, values):
+    for k in keys:
+        v = mapping[k]
         lines.append(f'\t{{ instr = "{k}"; icode = "{v}"; }}')
     print(',\n'.join(lines), file = f_mapping)
     print(');', file = f_mapping)
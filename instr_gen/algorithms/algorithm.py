@@ -20,7 +20,25 @@ class Algorithm(metaclass = abc.ABCMeta):
     def __init__(self, config: AlgConfig):
         self.config = config
 
+        # Statistics of the last solve (reported by --profile)
+        self.stats = {}
+
+
+    # Loads inputs shared by algorithms (e.g. benchmark counts), called in
+    # the main process before instruction groups are solved by workers.
+    # counts (icode -> count), if given, are used instead of benchmark files
+    def prepare(self, counts: dict = None) -> None:
+        pass
+
 
     @abc.abstractmethod
     def solve(self, instructions: list) -> Result:
         pass
+
+
+    # Solves for each number of uops in num_uops, returns dict num_uops ->
+    # Result and dict num_uops -> total latency error (empty for algorithms
+    # whose result does not depend on the number of uops)
+    def sweep(self, instructions: list, num_uops: list) -> (dict, dict):
+        result = self.solve(instructions)
+        return dict((k, result) for k in num_uops), {}
@@ -1,7 +1,6 @@
-import itertools
-
 from instr_gen.result import Result
 from instr_gen.result import ResInstruction, ResUop
+from instr_gen.instruction import InstructionTable
 
 from instr_gen.algorithms.algorithm import Algorithm, AlgConfig
 
@@ -12,29 +11,40 @@ class DirectBinary(Algorithm):
         self.result = Result()
 
 
-    # Translates port usage into list of uops
-    def _get_uops(self, ports: dict) -> list:
-        for i in self.config.params['port_fix']:
-            ports[i['port']] = 0
+    def _uop_name(self, uop: str) -> str:
+        return self.config.instruction_type + '_' + uop
+
 
-        # ans = [ [k] * v for k, v in ports.items() if v > 0 ]
-        # ans = list(itertools.chain.from_iterable(ans))
-        ans = [ k for k, v in ports.items() if v > 0 ]
-        return list(map(lambda x: self.config.port_to_uop[x], ans))
+    # Translates port signature (ports used after port_fix) into list of uops
+    def _get_uops(self, table: InstructionTable, signature: int) -> list:
+        ports = table.signature_ports(signature)
+        return [ self._uop_name(self.config.port_to_uop[p]) for p in ports ]
 
 
     def solve(self, instructions: list) -> Result:
-        uop_name = lambda x: self.config.instruction_type + '_' + x
+        signatures, index = [], []
+
+        # Instructions are grouped by port signature, the uops of each
+        # signature are computed once and shared by its instructions
+        if len(instructions) > 0:
+            table = instructions[0].table
+            port_fix = [ i['port'] for i in self.config.params['port_fix'] ]
+
+            signatures, index = table.port_signatures(
+                table.rows(instructions), port_fix
+            )
+            index = index.tolist()
+
+        uops_per_signature = [ self._get_uops(table, s) for s in signatures ]
+        self.stats = { 'signatures': len(signatures) }
 
         # For every instruction, get uops based on port usage and
         # config file specifications
-        for instr in instructions:
-            uops = self._get_uops(instr.ports)
-            res_instr = ResInstruction(instr.icode)
+        for instr, i in zip(instructions, index):
+            res_instr = ResInstruction(instr.icode, self.result.uop_table)
 
-            if len(uops) > 0:
-                for uop in uops:
-                    res_instr.add_uop(uop_name(uop))
+            for uop in uops_per_signature[i]:
+                res_instr.add_uop(uop)
 
             self.result.add_instruction(res_instr)
 
@@ -44,7 +54,7 @@ class DirectBinary(Algorithm):
 
         # Create uops based on config file
         for uop, lat in self.config.params['uop_latency'].items():
-            res_uop = ResUop(uop_name(uop), lat, self.config.uop_to_fu[uop][0], inv[uop])
+            res_uop = ResUop(self._uop_name(uop), lat, self.config.uop_to_fu[uop][0], inv[uop])
             self.result.add_uop(res_uop)
 
         return self.result
@@ -1,11 +1,10 @@
-import os
+import re
 import numpy as np
-import pandas as pd
 
 from itertools import accumulate
 from collections import defaultdict
 
-from instr_gen.instruction import Instruction
+from instr_gen import counts, parallel
 from instr_gen.result import Result, ResInstruction, ResUop
 from instr_gen.algorithms.algorithm import Algorithm, AlgConfig
 
@@ -15,34 +14,127 @@ class GroupRepPort(Algorithm):
     def __init__(self, config: AlgConfig):
         super().__init__(config)
 
-        self.result = Result()
+        self.icodes = []
         self.instr_dict = self.InstrDict(config)
+        self.cnt_per_icode = None
+
+
+    def prepare(self, counts: dict = None) -> None:
+        if counts is not None:
+            self.cnt_per_icode = counts
+        else:
+            self._setup_counts()
 
 
     def solve(self, instructions: list) -> Result:
-        self._setup_counts()
+        self._setup(instructions)
+        num_uops = self._num_uops(self.config.params['num_uops'])
+
+        # Solve and get answer
+        solver = self.Solver(self.instr_dict)
+        ans = solver.solve(num_uops)
+
+        result = self._build_result(ans)
+        self._report(solver, ans)
+        self._set_stats(solver)
+
+        return result
+
+
+    # Solves once for the greatest number of uops, then builds results
+    # for each of num_uops. Also returns total latency error for each
+    # number of uops up to the greatest one (only those the ports can
+    # actually be grouped into)
+    def sweep(self, instructions: list, num_uops: list) -> (dict, dict):
+        self._setup(instructions)
+
+        solver = self.Solver(self.instr_dict)
+        max_uops = max(num_uops)
+        solver.solve(self._num_uops(max_uops, verbose = False))
+
+        results = {}
+        for k in num_uops:
+            ans = solver.retrieve(self._num_uops(k))
+            results[k] = self._build_result(ans)
+            self._report(solver, ans, k)
+
+        errors = {}
+        for k in range(1, max_uops + 1):
+            if self._num_uops(k, verbose = False) == k:
+                errors[k] = solver.cost(k)
+
+        self._set_stats(solver)
+        return results, errors
+
+
+    # Keeps statistics of solver and of FU matchers' cache
+    def _set_stats(self, solver: "Solver") -> None:
+        matchers = self.instr_dict.matchers.values()
+        lookups = sum(m.lookups for m in matchers)
+        hits = sum(m.hits for m in matchers)
+
+        self.stats = dict(solver.stats)
+        self.stats['fu_match_lookups'] = lookups
+        self.stats['fu_match_hit_rate'] = hits / lookups if lookups > 0 else 0
+
+
+    # Retrieves counts and adds instructions to instr_dict
+    def _setup(self, instructions: list) -> None:
+        if self.cnt_per_icode is None:
+            self._setup_counts()
         self._setup_instructions(instructions)
 
-        # The max number of uops is limited by number of distinct latency values
-        num_uops = self.config.params['num_uops']
 
+    # Returns valid number of uops (closest to num_uops)
+    def _num_uops(self, num_uops: int, verbose: bool = True) -> int:
+        # The max number of uops is limited by number of distinct latency values
         max_num_uops = 0
         for v in self.instr_dict._set.values():
             max_num_uops += len(v.instr_per_lat)
 
         if num_uops > max_num_uops:
-            print(f'WARNING: num_uops set to {max_num_uops}')
+            if verbose:
+                print(f'WARNING: num_uops set to {max_num_uops}')
             num_uops = max_num_uops
 
-        # Solve and get answer
-        solver = self.Solver(self.instr_dict)
-        ans = solver.solve(num_uops)
+        # Every representative port needs at least one uop
+        min_num_uops = len(self.instr_dict.ports)
+
+        if num_uops < min_num_uops:
+            if verbose:
+                print(f'WARNING: num_uops set to {min_num_uops}')
+            num_uops = min_num_uops
+
+        return num_uops
+
+
+    # Creates result given grouped latency values of each port
+    def _build_result(self, ans: dict) -> Result:
+        result = Result()
+        instrs = {}
+
+        for icode in self.icodes:
+            instrs[icode] = ResInstruction(icode, result.uop_table)
+            result.add_instruction(instrs[icode])
+
+        self.instr_dict.reset()
+        for ii, pid in enumerate(self.instr_dict.ports):
+            for old_lat, new_lat in zip(self.instr_dict.vec_data(ii), ans[pid]):
+                self.instr_dict.set_uop(ii, old_lat, new_lat, instrs)
 
         for uop in self.instr_dict.uops:
-            self.result.uops.append(uop)
+            result.add_uop(uop)
+
+        return result
 
+
+    # Prints grouped latency values of each port
+    def _report(self, solver: "Solver", ans: dict, num_uops: int = None) -> None:
         print()
-        print(f'{self.config.instruction_type}:')
+        if num_uops is None:
+            print(f'{self.config.instruction_type}:')
+        else:
+            print(f'{self.config.instruction_type} (num_uops = {num_uops}):')
 
         for i in ans.keys():
             transf = lambda x: ' | '.join(list(map(lambda y: f'{y:10}', x)))
@@ -60,62 +152,63 @@ class GroupRepPort(Algorithm):
 
         print()
 
-        return self.result
-
 
-    # Parses benchmark files and retrieves count per instruction
+    # Retrieves count per instruction from benchmark files (shared store)
     def _setup_counts(self) -> None:
         path = str(self.config.params['counts_path'])
+        self.cnt_per_icode = counts.store.get(path)
 
-        directory = os.fsdecode(path)
-        self.cnt_per_icode = defaultdict(lambda: 0)
-
-        for f in os.listdir(directory):
-            filename = os.fsencode(f).decode("utf-8")
-            bench_csv = pd.read_csv(path + '/' + filename)
 
-            for i in bench_csv.iterrows():
-                self.cnt_per_icode[i[1]['icode']] += float(i[1]['count'])
+    # Returns core latency and representative port of every instruction.
+    # Each latency_fix rule is applied to all instructions at once, as a
+    # mask over a copy of their port usage matrix
+    def _get_instrs_data(self, instructions: list) -> (list, list):
+        if len(instructions) == 0:
+            return [], []
 
+        table = instructions[0].table
+        rows  = table.rows(instructions)
+        ports = table.port_matrix(rows)
+        lats  = table.max_lat[rows]
 
-    # Returns representative port given port usage
-    def _get_rep_port(self, ports: dict) -> str:
-        rep = max(ports, key = ports.get)
-        if ports[rep] > 0:
-            return rep
+        rules = self.config.params['latency_fix']
 
-        return None
+        # Presence of each operand used by rules in each instruction
+        names = list(dict.fromkeys(
+            j['name'] for i in rules for j in i.get('operands', [])
+        ))
+        operands = np.array([
+            [ name in ops for name in names ]
+            for ops in (instr.operands for instr in instructions)
+        ], dtype = bool).reshape(len(instructions), len(names))
 
+        for i in rules:
+            col = table.port_index[i['port']]
+            used = ports[:, col] > 0
 
-    # Returns core latency and representative port
-    def _get_instr_data(self, instr: Instruction) -> (int, int):
-        lat = instr.max_lat
-        ports = instr.ports
+            lats[used] -= i['lat']
+            ports[used, col] = 0
 
-        for i in self.config.params['latency_fix']:
-            if ports[i['port']] > 0:
-                lat -= i['lat']
-                ports[i['port']] = 0
+            for j in i.get('operands', []):
+                has_operand = operands[:, names.index(j['name'])]
+                lats[used & has_operand] -= j['lat']
 
-                for j in i.get('operands', []):
-                    if j['name'] in instr.operands:
-                        lat -= j['lat']
-
-        return max(lat, 1), self._get_rep_port(ports)
+        lats = np.maximum(lats, 1)
+        return table.latencies(lats), table.argmax_ports(ports)
 
 
     # Adds all instructions to instr_dict
     def _setup_instructions(self, instructions: list) -> None:
-        for instr in instructions:
-            res_instr = ResInstruction(instr.icode)
-            self.result.add_instruction(res_instr)
+        lats, reps = self._get_instrs_data(instructions)
+
+        for instr, lat, rep in zip(instructions, lats, reps):
+            self.icodes.append(instr.icode)
 
-            lat, rep = self._get_instr_data(instr)
             if rep != None:
-                cnt = self.cnt_per_icode[instr.icode]
+                cnt = self.cnt_per_icode.get(instr.icode, 0)
 
-                # Add res_instr to instr_dict, to be set when solved
-                self.instr_dict.add_instruction(res_instr, cnt, lat, rep)
+                # Add instruction to instr_dict, uops are set when solved
+                self.instr_dict.add_instruction(instr.icode, cnt, lat, rep)
 
 
 
@@ -133,18 +226,27 @@ class GroupRepPort(Algorithm):
 
         # Called by InstrDict, adds instruction to dicts based on its latency
         def add_instruction(self,
-                            instr: ResInstruction,
+                            icode: str,
                             count: int,
                             lat: int) -> None:
-            self.instr_per_lat[lat].append(instr)
+            self.instr_per_lat[lat].append(icode)
             self.count_per_lat[lat] += count
 
 
+        # Forgets uops created by set_uop
+        def reset(self) -> None:
+            self.uop_counter = 0
+            self.new_uops = {}
+
+
         # Returns list of new uops and adds created uops to set's instructions
+        # (instrs maps icode -> ResInstruction)
         def set_uop(self,
                     old_lat: int,
                     new_lat: int,
-                    config: AlgConfig) -> ResUop:
+                    config: AlgConfig,
+                    instrs: dict,
+                    fu_matcher) -> ResUop:
 
             # Keep track of uops by new_lat
             if new_lat not in self.new_uops:
@@ -163,26 +265,16 @@ class GroupRepPort(Algorithm):
             uop_name, fus = self.new_uops[new_lat]
 
             # Add uop to instructions with latency=old_lat in this set
-            for i, instr in enumerate(self.instr_per_lat[old_lat]):
+            for icode in self.instr_per_lat[old_lat]:
+                instr = instrs[icode]
 
                 # Some uops may be related to more than one functional unit (FU)
                 if len(fus) > 1:
-                    target_fu = ''
-
                     # In this case, samples provided in config file are
                     # analysed in order to figure out which FU is the
                     # best fit for the current instruction
-                    for fi, fu in enumerate(fus):
-                        for samp in config.params['samples']:
-                            if fu == samp['fu']:
-                                for samp_instr in samp['instructions']:
-                                    if samp_instr in instr.icode:
-                                        target_fu = str(fi)
-
-                    if target_fu == '':
-                        target_fu = '0'
-
-                    instr.add_uop(uop_name + '_' + target_fu)
+                    target_fu = fu_matcher(fus).match(icode)
+                    instr.add_uop(uop_name + '_' + str(target_fu))
 
                 # Otherwise, just add the uop
                 else:
@@ -211,6 +303,42 @@ class GroupRepPort(Algorithm):
 
 
 
+    # Picks which of the FUs of a uop best fits an instruction: the last FU
+    # with a sample (from config) contained in the icode, or the first FU
+    # if none matches. Samples of each FU are compiled into one regex and
+    # the FU of each icode is computed only once
+    class FUMatcher:
+        def __init__(self, fus: list, samples: list):
+            self.patterns = []
+            for fu in fus:
+                names = [
+                    re.escape(i)
+                    for samp in samples if samp['fu'] == fu
+                    for i in samp['instructions']
+                ]
+                self.patterns.append(re.compile('|'.join(names)) if names else None)
+
+            self._cache = {}
+            self.lookups, self.hits = 0, 0
+
+
+        def match(self, icode: str) -> int:
+            self.lookups += 1
+            if icode in self._cache:
+                self.hits += 1
+            else:
+                self._cache[icode] = 0
+
+                for fi in reversed(range(len(self.patterns))):
+                    pattern = self.patterns[fi]
+                    if pattern is not None and pattern.search(icode):
+                        self._cache[icode] = fi
+                        break
+
+            return self._cache[icode]
+
+
+
     # Set of all instructions
     class InstrDict:
         def __init__(self, config: AlgConfig):
@@ -222,10 +350,13 @@ class GroupRepPort(Algorithm):
             self.uops = []
             self.ports = []
 
+            # FU matchers by list of FUs (kept across results)
+            self.matchers = {}
+
 
         # Called by algorithm, adds instructions to the corresponding set
         def add_instruction(self,
-                            instr: ResInstruction,
+                            icode: str,
                             count: int,
                             lat: int,
                             rep: str) -> None:
@@ -233,7 +364,24 @@ class GroupRepPort(Algorithm):
                 self.ports.append(rep)
                 self._set[rep] = GroupRepPort.InstrSet(rep)
 
-            self._set[rep].add_instruction(instr, count, lat)
+            self._set[rep].add_instruction(icode, count, lat)
+
+
+        # Forgets uops created by set_uop (to build another result)
+        def reset(self) -> None:
+            self.uops = []
+            for v in self._set.values():
+                v.reset()
+
+
+        # Returns matcher of FUs, shared by every set
+        def fu_matcher(self, fus: list) -> "GroupRepPort.FUMatcher":
+            key = tuple(fus)
+            if key not in self.matchers:
+                samples = self.config.params['samples']
+                self.matchers[key] = GroupRepPort.FUMatcher(fus, samples)
+
+            return self.matchers[key]
 
 
         def get_data(self) -> (dict, dict):
@@ -242,16 +390,24 @@ class GroupRepPort(Algorithm):
             return vec, cnt
 
 
+        # Returns sorted latency values of port ii
+        def vec_data(self, ii: int) -> list:
+            return self._set[self.ports[ii]].vec_data
+
+
         # Lets set add uops to instructions and adds new uops to result
         def set_uop(self,
                     ii: int,
                     old_lat: int,
-                    new_lat: int) -> None:
+                    new_lat: int,
+                    instrs: dict) -> None:
 
             new_uops = self._set[self.ports[ii]].set_uop(
                 old_lat,
                 new_lat,
-                self.config
+                self.config,
+                instrs,
+                self.fu_matcher
             )
 
             for uop in new_uops:
@@ -259,8 +415,16 @@ class GroupRepPort(Algorithm):
 
 
 
-    # Solver helper class
+    # Solver helper class. Grouping the latencies of each representative port
+    # is an independent 1-D weighted clustering problem: every port is solved
+    # alone for every number of uops it may get (in parallel), then the total
+    # number of uops is split among ports by a min-plus (knapsack) merge
     class Solver:
+        # Ports are solved by worker processes only if the total work (sum
+        # of M^2 * K, M = latencies of port, K = max uops of port) pays off
+        # the pool overhead
+        PARALLEL_MIN_WORK = 10**6
+
         def __init__(self, instr_dict: "InstrDict"):
             self.instr_dict = instr_dict
             self.vec, self.cnt = self.instr_dict.get_data()
@@ -270,97 +434,200 @@ class GroupRepPort(Algorithm):
             # After execution, will contain grouped latency values
             self.ans = dict([ (k, [0]*len(v)) for k, v in self.vec.items() ])
 
-            # Used by dynamic programming
-            self.dp  = np.zeros((200, 200, 40),    dtype = object)
-            self.res = np.zeros((200, 200, 40, 2), dtype = object)
-
-            self.dp.fill(-1)
-
+            # Prefix sums of cnt and cnt*vec, used by the cost function
+            self.sum_cnt, self.sum_lat = {}, {}
+            for k in self.vec.keys():
+                lat = map(lambda x: x[0] * x[1], zip(self.vec[k], self.cnt[k]))
+                self.sum_cnt[k] = list(accumulate(self.cnt[k], initial = 0))
+                self.sum_lat[k] = list(accumulate(lat, initial = 0))
 
-        # Cost function
-        def C(self, l: int, r: int, ii: int) -> int:
-            pid = self.pid(ii)
-            new_lat = self._weighted_avg(l, r, ii)
+            # port_cost[ii][k] is the min cost of grouping latencies of port
+            # ii into k uops, port_cuts[ii][k] the last latency of each group
+            self.port_cost, self.port_cuts = [], []
 
-            new, old = 0, 0
-            for i in range(l, r + 1):
-                new += self.cnt[pid][i] * new_lat
-                old += self.cnt[pid][i] * self.vec[pid][i]
+            # Used by merge, res[ii][b] is the number of uops given to port
+            # ii when b uops are left for ports ii..N-1, total_cost[b] is the
+            # min cost of grouping all latencies into b uops
+            self.res = []
+            self.total_cost = None
 
-            return abs(new - old)
+            # Sizes of the last solve (reported by --profile)
+            self.stats = {}
 
 
         # Weighted average of vec using cnt as weights
-        # (can be optimized with prefix sum vectors, only if necessary)
         def _weighted_avg(self, l: int, r: int, ii: int) -> int:
             pid = self.pid(ii)
 
-            ss, bot = 0, 0
-            for i in range(l, r + 1):
-                ss += self.vec[pid][i] * self.cnt[pid][i]
-                bot += self.cnt[pid][i]
+            ss = self.sum_lat[pid][r + 1] - self.sum_lat[pid][l]
+            bot = self.sum_cnt[pid][r + 1] - self.sum_cnt[pid][l]
 
             return round(ss / bot)
 
 
+        # Cost matrix given prefix sums: costs[l, r] is the cost of grouping
+        # latencies l..r into one uop, |cnt * weighted avg - sum of cnt * lat|
+        # with the average rounded as _weighted_avg does (inf if r < l)
+        @staticmethod
+        def _costs(sum_cnt: list, sum_lat: list) -> np.ndarray:
+            sum_cnt = np.array(sum_cnt, dtype = np.float64)
+            sum_lat = np.array(sum_lat, dtype = np.float64)
+
+            cnt = sum_cnt[None, 1:] - sum_cnt[:-1, None]
+            old = sum_lat[None, 1:] - sum_lat[:-1, None]
+
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                costs = np.abs(cnt * np.round(old / cnt) - old)
+
+            return np.where(np.triu(np.ones_like(costs, dtype = bool)),
+                            costs, np.inf)
+
+
+        # Solves a single port (prefix sums and max number of uops K) for
+        # every number of uops up to K, bottom-up: dp[i, k] is the min cost
+        # of grouping latencies i.. into k uops. Returns (cost of each k,
+        # last latency of each group for each k)
+        @staticmethod
+        def _solve_port(port: tuple) -> tuple:
+            sum_cnt, sum_lat, K = port
+            costs = GroupRepPort.Solver._costs(sum_cnt, sum_lat)
+            M = len(costs)
+
+            dp  = np.full((M + 1, K + 1), np.inf, dtype = np.float64)
+            res = np.full((M + 1, K + 1), -1, dtype = np.int64)
+            dp[M, 0] = 0
+
+            for i in reversed(range(M)):
+                # Grouping i..j uses one uop, remaining k-1 start at j+1
+                x = dp[i + 1:, :K] + costs[i, i:, None]
+
+                # argmin returns first minimum (smallest j on ties)
+                best = np.argmin(x, axis = 0)
+                mn = x[best, np.arange(K)]
+
+                dp[i, 1:] = mn
+                res[i, 1:] = np.where(np.isfinite(mn), best + i, -1)
+
+            cuts = [ [] ]
+            for k in range(1, K + 1):
+                cuts.append([])
+
+                i = 0
+                for kk in range(k, 0, -1):
+                    cuts[k].append(int(res[i, kk]))
+                    i = cuts[k][-1] + 1
+
+            return dp[0], cuts
+
+
+        # Number of DP states evaluated to solve a port of M latencies
+        # for up to K uops
+        @staticmethod
+        def _port_states(M: int, K: int) -> int:
+            return M * (M + 1) // 2 * K
+
+
         # Returns result of optimization
         def solve(self, K: int) -> dict:
-            self._solve(0, K, 0)
-            self._retrieve(0, K, 0)
+            self._solve(K)
+            return self.retrieve(K)
+
+
+        # Returns result for K uops (K must not exceed the solved one)
+        def retrieve(self, K: int) -> dict:
+            self.ans = dict([ (k, [0]*len(v)) for k, v in self.vec.items() ])
+            self._retrieve(K)
 
             return self.ans
 
 
+        # Returns total cost (weighted latency error) of K uops
+        def cost(self, K: int) -> float:
+            return float(self.total_cost[K])
+
+
         # Returns port string given integer id
         def pid(self, ii: int) -> str:
             return self.instr_dict.ports[ii]
 
 
-        # Solves problem recursively
-        def _solve(self, i: int, k: int, ii: int) -> int:
-            inf = 10**25
-            if ii == self.N:
-                if k != 0:
-                    return inf
-                return 0
+        # Solves every port alone, then merges ports from the last one
+        # backwards (min-plus convolution of their costs)
+        def _solve(self, K: int) -> None:
+            # A port gets at most its number of latencies, and at most what
+            # is left after every other port gets one uop
+            M = [ len(self.vec[self.pid(ii)]) for ii in range(self.N) ]
+            Kp = [ min(m, max(1, K - self.N + 1)) for m in M ]
+
+            ports = [
+                (self.sum_cnt[self.pid(ii)], self.sum_lat[self.pid(ii)], Kp[ii])
+                for ii in range(self.N)
+            ]
 
-            # Dynamic programming (memoization)
-            if self.dp[i, k, ii] != -1:
-                return self.dp[i, k, ii]
+            work = sum(m * m * k for m, k in zip(M, Kp))
+            jobs = None if work >= self.PARALLEL_MIN_WORK else 1
 
-            mn = inf
-            M = len(self.vec[self.pid(ii)])
+            ports = parallel.map_ordered(
+                GroupRepPort.Solver._solve_port, ports, jobs
+            )
 
-            for j in range(i, M):
-                next_i  = (j + 1) % M
-                next_ii = ii if (j + 1 < M) else ii + 1
+            self.port_cost = [ cost for cost, _ in ports ]
+            self.port_cuts = [ cuts for _, cuts in ports ]
+            self.res = [ None ] * self.N
 
-                x = self._solve(next_i, k - 1, next_ii) + self.C(i, j, ii)
+            # Cost after the last port (only valid if no uop is left)
+            nxt = np.full(K + 1, np.inf)
+            nxt[0] = 0
 
-                if x < mn:
-                    mn = x
-                    self.res[i, k, ii, 0] = next_i
-                    self.res[i, k, ii, 1] = next_ii
+            for ii in reversed(range(self.N)):
+                P = len(self.port_cost[ii]) - 1
+                ks = np.arange(1, P + 1)
 
-            self.dp[i, k, ii] = mn
-            return self.dp[i, k, ii]
+                # x[k-1, b] = cost of k uops on ii + cost of b-k on the rest
+                left = np.arange(K + 1)[None, :] - ks[:, None]
+                x = self.port_cost[ii][1:, None] + np.where(
+                    left >= 0, nxt[np.maximum(left, 0)], np.inf
+                )
 
+                # Ties are broken as the sequential DP does: smallest
+                # last latency of the first group, then of the next, ...
+                order = sorted(range(P), key = lambda k: self.port_cuts[ii][k + 1])
+                rank = np.empty(P, dtype = np.int64)
+                rank[order] = np.arange(P)
 
-        # Builds result recursively by checking res table
-        def _retrieve(self, i: int, k: int, ii: int) -> None:
-            if ii == self.N:
-                return
+                mn = x.min(axis = 0)
+                tied = (x == mn[None, :]) & np.isfinite(x)
+                best = np.argmin(np.where(tied, rank[:, None], P), axis = 0)
 
-            pid = self.pid(ii)
-            if self.res[i, k, ii, 0] == 0:
-                lim = len(self.vec[pid])
-            else:
-                lim = self.res[i, k, ii, 0]
+                self.res[ii] = np.where(np.isfinite(mn), best + 1, -1)
+                nxt = mn
+
+            self.total_cost = nxt
+
+            self.stats = {
+                'num_uops': K,
+                'ports': self.N,
+                'latencies': sum(M),
+                'dp_states': sum(self._port_states(m, k) for m, k in zip(M, Kp)),
+                'merge_states': sum(k * (K + 1) for k in Kp)
+            }
+
+
+        # Groups latencies by following res table and cuts of each port
+        def _retrieve(self, K: int) -> None:
+            b = K
+
+            for ii in range(self.N):
+                pid = self.pid(ii)
+                k = int(self.res[ii][b])
+
+                i = 0
+                for j in self.port_cuts[ii][k]:
+                    x = self._weighted_avg(i, j, ii)
 
-            x = self._weighted_avg(i, lim - 1, ii)
+                    for t in range(i, j + 1):
+                        self.ans[pid][t] = x
 
-            for j in range(i, lim):
-                self.instr_dict.set_uop(ii, self.vec[pid][j], x)
-                self.ans[pid][j] = x
+                    i = j + 1
 
-            self._retrieve(self.res[i, k, ii, 0], k - 1, self.res[i, k, ii, 1])
+                b -= k
@@ -0,0 +1,95 @@
+import io
+import libconf
+import contextlib
+
+from instr_gen import parallel
+from instr_gen.cache import MeasurementTable
+from instr_gen.config import Config, InstructionGroup
+from instr_gen.counts import read_counts
+from instr_gen.icode_mapping import read_mapping
+from instr_gen.parser import parse_all
+from instr_gen.result import Result
+
+# In-memory API of the generator. Inputs are loaded once and reused by any
+# number of generate calls, e.g.:
+#
+#   mapping = load_icode_mapping('icode_mapping.cfg')
+#   config = load_config('config_skl.cfg', mapping)
+#   table = load_instructions('instructions.xml')
+#   cnts = load_counts('counts/')
+#
+#   result = generate(config, table, cnts)
+#   result.instruction('ADDPS_XMMps_XMMps').uops
+#
+# Nothing is written unless asked (Result.output, output_functional_units)
+
+
+# Returns icode mapping (instruction string -> icode) of libconfig file
+def load_icode_mapping(path: str) -> dict:
+    return read_mapping(path)
+
+
+# Returns config given either libconfig file path or already loaded
+# document (libconf or json dict)
+def load_config(config, icode_mapping: dict) -> Config:
+    if isinstance(config, str):
+        with io.open(config) as f:
+            config = libconf.load(f)
+
+    return Config.from_data(config, icode_mapping)
+
+
+# Returns measurements of every instruction of xml (of archs, if given)
+def load_instructions(xml_path: str, archs: list = None) -> MeasurementTable:
+    table = MeasurementTable.build(xml_path)
+
+    if archs is not None:
+        table.archs = dict((k, v) for k, v in table.archs.items() if k in archs)
+
+    return table
+
+
+# Returns counts (icode -> count) summed over benchmark files of directory
+def load_counts(path: str) -> dict:
+    return read_counts(path)
+
+
+# Generates result of config. instructions is either a MeasurementTable or
+# a path to instructions.xml; if None, instructions of the previous call are
+# reused. counts (icode -> count) replaces benchmark files of algorithms
+# that need them. Groups (and ports of large groups) are solved by at most
+# jobs processes (serially by default), their reports are printed only if
+# verbose
+def generate(config: Config,
+             instructions = None,
+             counts: dict = None,
+             jobs: int = 1,
+             verbose: bool = False) -> Result:
+
+    if instructions is None:
+        config.reset()
+    elif isinstance(instructions, MeasurementTable):
+        config.reset(clear = True)
+        parse_all(None, [ config ], instructions)
+    else:
+        config.reset(clear = True)
+        parse_all(instructions, [ config ])
+
+    config.prepare(counts)
+
+    # Solvers use parallel.jobs, so it is set for the call only
+    default_jobs = parallel.jobs
+    parallel.jobs = jobs
+
+    out = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with out:
+            solved = parallel.map_ordered(InstructionGroup.solve, config.instr_groups)
+    finally:
+        parallel.jobs = default_jobs
+
+    result = Result()
+    for res in solved:
+        result.merge(res)
+
+    return result
@@ -0,0 +1,245 @@
+import os
+import math
+import zipfile
+import hashlib
+import numpy as np
+
+from instr_gen.writer import atomic_open
+
+# Strings of the same column are stored joined by this separator
+SEP = '\n'
+
+# Version of the layout of cached tables (part of their file names), must
+# be changed whenever extraction or layout changes so old caches are ignored
+VERSION = 1
+
+# Errors of unreadable or corrupt cache files (these are built again)
+LOAD_ERRORS = (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile)
+
+
+# Returns default directory where caches are stored
+def default_cache_dir() -> str:
+    base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'instr_gen')
+
+
+# Returns hexadecimal digest of file's content
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size = 16)
+
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+# Writes npz file atomically (readers never see a half-written cache)
+def save_npz(path: str, arrays: dict) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok = True)
+
+    with atomic_open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def pack_strings(strings: list) -> np.ndarray:
+    return np.frombuffer(SEP.join(strings).encode('utf-8'), dtype = np.uint8)
+
+
+def unpack_strings(arr: np.ndarray) -> list:
+    if len(arr) == 0:
+        return []
+    return arr.tobytes().decode('utf-8').split(SEP)
+
+
+
+# Interns strings into a list, returning their indices (None is -1)
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+
+    def add(self, s: str) -> int:
+        if s is None:
+            return -1
+
+        if s not in self.index:
+            self.index[s] = len(self.strings)
+            self.strings.append(s)
+
+        return self.index[s]
+
+
+
+# Measurements of every instruction for every architecture, extracted from
+# instructions.xml once and stored in columnar form. Instruction data is
+# shared by all architectures, measurements are stored per architecture
+# so that only rows of the target architecture are loaded
+class MeasurementTable:
+    def __init__(self, instructions: dict, archs: dict):
+        # Columns: name, iform, extension (lists of str)
+        self.instructions = instructions
+
+        # Architecture -> columns: instr, num_uops, min_lat, max_lat,
+        # ports, throughput (numpy arrays, strings are indices in tables)
+        self.archs = archs
+
+
+    # Extracts measurements from xml (for every architecture)
+    @classmethod
+    def build(cls, xml_path: str) -> "MeasurementTable":
+        # Imported here, parser depends on config which depends on counts
+        from instr_gen.parser import iter_instruction_nodes, parse_architectures
+
+        names, iforms, exts = [], [], []
+        strings = StringTable()
+        rows = {}
+
+        for instr_node in iter_instruction_nodes(xml_path):
+            idx = len(names)
+            names.append(instr_node.attrib.get('string'))
+            iforms.append(instr_node.attrib.get('iform') or '')
+            exts.append(instr_node.attrib['extension'])
+
+            for arch, args in parse_architectures(instr_node).items():
+                if arch not in rows:
+                    rows[arch] = dict((k, []) for k in [
+                        'instr', 'num_uops', 'min_lat', 'max_lat',
+                        'ports', 'throughput'
+                    ])
+
+                row = rows[arch]
+                row['instr'].append(idx)
+                row['num_uops'].append(args['num_uops'])
+                row['min_lat'].append(args['min_lat'])
+                row['max_lat'].append(args['max_lat'])
+                row['ports'].append(strings.add(args['ports']))
+                row['throughput'].append(strings.add(args['throughput']))
+
+        archs = {}
+        for arch, row in rows.items():
+            archs[arch] = {
+                'instr':      np.array(row['instr'],      dtype = np.int32),
+                'num_uops':   np.array(row['num_uops'],   dtype = np.int32),
+                'min_lat':    np.array(row['min_lat'],    dtype = np.float64),
+                'max_lat':    np.array(row['max_lat'],    dtype = np.float64),
+                'ports':      np.array(row['ports'],      dtype = np.int32),
+                'throughput': np.array(row['throughput'], dtype = np.int32)
+            }
+
+        instructions = {
+            'name': names,
+            'iform': iforms,
+            'extension': exts,
+            'strings': strings.strings
+        }
+
+        return cls(instructions, archs)
+
+
+    def save(self, path: str) -> None:
+        arrays = {}
+        for k, v in self.instructions.items():
+            arrays[k] = pack_strings(v)
+
+        arrays['archs'] = pack_strings(list(self.archs.keys()))
+        for arch, cols in self.archs.items():
+            for k, v in cols.items():
+                arrays[f'{arch}/{k}'] = v
+
+        save_npz(path, arrays)
+
+
+    # Loads table from npz file, only columns of the specified architectures
+    # are read (all of them if archs is None)
+    @classmethod
+    def load(cls, path: str, archs: list = None) -> "MeasurementTable":
+        with np.load(path) as data:
+            available = unpack_strings(data['archs'])
+            if archs is None:
+                archs = available
+
+            instructions = {}
+            for k in ['name', 'iform', 'extension', 'strings']:
+                instructions[k] = unpack_strings(data[k])
+
+            table = {}
+            for arch in archs:
+                if arch not in available:
+                    continue
+
+                table[arch] = dict(
+                    (k, data[f'{arch}/{k}']) for k in [
+                        'instr', 'num_uops', 'min_lat', 'max_lat',
+                        'ports', 'throughput'
+                    ]
+                )
+
+        return cls(instructions, table)
+
+
+    # Yields args of instructions measured on arch (xml order), extensions
+    # not accepted by check_extension are skipped
+    def records(self, arch: str, check_extension = None):
+        if arch not in self.archs:
+            return
+
+        cols = dict((k, v.tolist()) for k, v in self.archs[arch].items())
+        names = self.instructions['name']
+        iforms = self.instructions['iform']
+        exts = self.instructions['extension']
+        strings = self.instructions['strings']
+
+        lat = lambda x: int(x) if not math.isnan(x) else math.nan
+        string = lambda x: strings[x] if x >= 0 else None
+
+        for i, idx in enumerate(cols['instr']):
+            if check_extension and not check_extension(exts[idx]):
+                continue
+
+            yield {
+                'name':       names[idx],
+                'iform':      iforms[idx] or None,
+                'extension':  exts[idx],
+                'throughput': string(cols['throughput'][i]),
+                'ports':      string(cols['ports'][i]),
+                'num_uops':   cols['num_uops'][i],
+                'min_lat':    lat(cols['min_lat'][i]),
+                'max_lat':    lat(cols['max_lat'][i])
+            }
+
+
+
+# Returns measurements of xml_path for the given architectures, loading them
+# from cache_dir when the xml was already extracted (cache is keyed by the
+# layout version and the xml's content hash) or extracting and caching them
+# otherwise
+def load_measurements(xml_path: str,
+                      cache_dir: str,
+                      archs: list = None,
+                      rebuild: bool = False) -> MeasurementTable:
+
+    name = f'measurements-v{VERSION}-{file_hash(xml_path)}.npz'
+    path = os.path.join(cache_dir, name)
+
+    if not rebuild and os.path.exists(path):
+        try:
+            return MeasurementTable.load(path, archs)
+        except LOAD_ERRORS:
+            # Unreadable caches are extracted again
+            pass
+
+    table = MeasurementTable.build(xml_path)
+
+    # Caching is best-effort, the table is used even if it can't be saved
+    try:
+        table.save(path)
+    except OSError as e:
+        print(f'WARNING: measurements not cached ({e})')
+
+    if archs is not None:
+        table.archs = dict((k, v) for k, v in table.archs.items() if k in archs)
+
+    return table
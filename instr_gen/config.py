@@ -1,8 +1,10 @@
 import io, libconf
 from collections import defaultdict
 
+from instr_gen import icode_mapping
 from instr_gen.result import Result
-from instr_gen.instruction import Instruction
+from instr_gen.writer import atomic_open, write_list
+from instr_gen.instruction import Instruction, InstructionTable
 
 from instr_gen.algorithms.algorithm import AlgConfig
 from instr_gen.algorithms.direct_binary import DirectBinary
@@ -34,11 +36,25 @@ class InstructionGroup:
         self.instructions.append(instr)
 
 
+    def prepare(self, counts: dict = None) -> None:
+        self.algorithm.prepare(counts)
+
+
+    @property
+    def stats(self) -> dict:
+        return dict(instructions = len(self.instructions), **self.algorithm.stats)
+
+
     def solve(self) -> Result:
         self.instructions.sort(key = lambda x: x.icode)
         return self.algorithm.solve(self.instructions)
 
 
+    def sweep(self, num_uops: list) -> (dict, dict):
+        self.instructions.sort(key = lambda x: x.icode)
+        return self.algorithm.sweep(self.instructions, num_uops)
+
+
 
 class FunctionalUnit:
     def __init__(self, config: libconf.AttrDict):
@@ -55,15 +71,31 @@ class FunctionalUnit:
 
 
 class Config:
-    def __init__(self, cfg_path, icode_path):
+    def __init__(self, cfg_path, icode_path, icode_mapping: dict = None):
 
         # Load config using libconf library
         with io.open(cfg_path) as f:
             config = libconf.load(f)
 
-        # Parse icode mapping
-        self.icode_mapping = {}
-        self._parse_icodes(icode_path)
+        # Parse icode mapping (unless already parsed by another config)
+        if icode_mapping is None:
+            icode_mapping = {}
+            self._parse_icodes(icode_mapping, icode_path)
+
+        self._setup(config, icode_mapping)
+
+
+    # Creates config from already loaded data (e.g. a libconf or json
+    # document) and icode mapping
+    @classmethod
+    def from_data(cls, config: dict, icode_mapping: dict) -> "Config":
+        self = cls.__new__(cls)
+        self._setup(config, icode_mapping)
+        return self
+
+
+    def _setup(self, config: dict, icode_mapping: dict) -> None:
+        self.icode_mapping = icode_mapping
 
         # Parse architecture
         self.arch = config['arch']
@@ -71,6 +103,9 @@ class Config:
         # Parse ports
         self.ports = config['ports']
 
+        # Instructions of every group are stored in a single table
+        self.table = InstructionTable(self.ports)
+
         # Parse functional units
         self.functional_units = [
             FunctionalUnit(i)
@@ -78,10 +113,15 @@ class Config:
         ]
 
         # Parse and create extension groups
+        self.groups_config = config['instruction_groups']
+        self._create_groups()
+
+
+    def _create_groups(self) -> None:
         self.instr_type = {}
         self.instr_groups = []
 
-        for cfg in config['instruction_groups']:
+        for cfg in self.groups_config:
             instr_group = InstructionGroup(cfg)
             self.instr_groups.append(instr_group)
 
@@ -90,13 +130,21 @@ class Config:
                 self.instr_type[ext] = instr_group
 
 
-    # Parses icode mapping libconfig file
-    def _parse_icodes(self, path: str) -> None:
-        with io.open(path) as f:
-            data = libconf.load(f)
+    # Creates instruction groups again (fresh algorithms), so config can be
+    # solved again. Instructions already added are kept unless clear is set
+    def reset(self, clear: bool = False) -> None:
+        if clear:
+            self.table = InstructionTable(self.ports)
+
+        self._create_groups()
+        for i in range(len(self.table)):
+            self.add_instruction(Instruction(self.table, i))
+
 
-        for i in data['instructions']:
-            self.icode_mapping[i['instr']] = i['icode']
+    # Parses icode mapping libconfig file (or loads its compiled form)
+    @staticmethod
+    def _parse_icodes(mapping: dict, path: str) -> None:
+        mapping.update(icode_mapping.load_mapping(path))
 
 
     # Adds instruction to appropriate instruction group
@@ -110,17 +158,24 @@ class Config:
         return ext in self.instr_type
 
 
+    # Loads inputs of every instruction group before solving (counts, if
+    # given, replace the ones read from benchmark files)
+    def prepare(self, counts: dict = None) -> None:
+        for instr_group in self.instr_groups:
+            instr_group.prepare(counts)
+
+
     # Some algorithms don't require latency for each instruction
     def need_latency(self, ext: str) -> bool:
         return self.instr_type[ext].need_latency
 
 
-    def output_functional_units(self, name: str) -> None:
+    # Writes functional units (sorted by name) to text file f
+    def write_functional_units(self, f) -> None:
         self.functional_units.sort(key = lambda x: x.name)
+        write_list(f, 'FUNCTIONAL_UNITS', self.functional_units)
 
-        with open(name + '_functional_units.cfg', 'w+') as f:
-            lines = [ f'\t{{ {str(i)} }}' for i in self.functional_units ]
-        
-            print('FUNCTIONAL_UNITS = (', file = f)
-            print(',\n'.join(lines), file = f)
-            print(');', file = f)
\ No newline at end of file
+
+    def output_functional_units(self, name: str) -> None:
+        with atomic_open(name + '_functional_units.cfg') as f:
+            self.write_functional_units(f)
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from instr_gen import parallel
+from instr_gen.cache import VERSION, LOAD_ERRORS
+from instr_gen.cache import pack_strings, unpack_strings, save_npz
+
+
+# Reads icode and count columns of a benchmark csv file
+def read_count_file(path: str) -> pd.DataFrame:
+    return pd.read_csv(path,
+        usecols = ['icode', 'count'],
+        dtype = { 'icode': str, 'count': np.float64 }
+    )
+
+
+# Returns dict icode -> total count over all benchmark files in directory
+# (files are read in parallel and summed with a single groupby)
+def read_counts(path: str) -> dict:
+    directory = os.fsdecode(path)
+    files = [ os.path.join(path, f) for f in sorted(os.listdir(directory)) ]
+
+    if len(files) == 0:
+        return {}
+
+    workers = parallel.num_workers(len(files))
+    with ThreadPoolExecutor(workers) as pool:
+        frames = list(pool.map(read_count_file, files))
+
+    counts = pd.concat(frames, ignore_index = True)
+    return counts.groupby('icode', sort = False)['count'].sum().to_dict()
+
+
+# Returns signature of directory's content (file names, sizes and mtimes),
+# any change to a benchmark file changes the signature
+def dir_signature(path: str) -> str:
+    digest = hashlib.blake2b(digest_size = 16)
+
+    for f in sorted(os.listdir(os.fsdecode(path))):
+        st = os.stat(os.path.join(path, f))
+        digest.update(f'{f}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+
+# Process-wide store of aggregated counts (icode -> count) per directory.
+# Directories are read once per process and, if cache_dir is set, tables
+# are also cached on disk until the directory's signature changes
+class CountsStore:
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir
+        self._counts = {}
+
+
+    # Returns path of the on-disk cache of directory
+    def _cache_path(self, path: str) -> str:
+        key = hashlib.blake2b(os.path.abspath(path).encode('utf-8'),
+                              digest_size = 16).hexdigest()
+        return os.path.join(self.cache_dir, f'counts-v{VERSION}-{key}.npz')
+
+
+    # Returns cached counts (None if missing, stale or unreadable)
+    def _load(self, path: str, signature: str) -> dict:
+        cache_path = self._cache_path(path)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with np.load(cache_path) as data:
+                if unpack_strings(data['signature']) != [ signature ]:
+                    return None
+
+                icodes = unpack_strings(data['icode'])
+                return dict(zip(icodes, data['count'].tolist()))
+        except LOAD_ERRORS:
+            return None
+
+
+    def _save(self, path: str, signature: str, counts: dict) -> None:
+        save_npz(self._cache_path(path), {
+            'signature': pack_strings([ signature ]),
+            'icode':     pack_strings(list(counts.keys())),
+            'count':     np.array(list(counts.values()), dtype = np.float64)
+        })
+
+
+    # Returns counts of directory, reading benchmark files only if neither
+    # memory nor disk have them for the current content of the directory
+    def get(self, path: str) -> dict:
+        key = os.path.abspath(path)
+        signature = dir_signature(path)
+
+        if key in self._counts and self._counts[key][0] == signature:
+            return self._counts[key][1]
+
+        counts = None
+        if self.cache_dir is not None:
+            counts = self._load(path, signature)
+
+        if counts is None:
+            counts = read_counts(path)
+            if self.cache_dir is not None:
+                # Caching is best-effort, counts are used even if not saved
+                try:
+                    self._save(path, signature, counts)
+                except OSError as e:
+                    print(f'WARNING: counts of {path} not cached ({e})')
+
+        self._counts[key] = (signature, counts)
+        return counts
+
+
+# Store shared by every algorithm of the process (cache_dir is set by main)
+store = CountsStore()
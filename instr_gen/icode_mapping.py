@@ -0,0 +1,99 @@
+import io
+import os
+import re
+import marshal
+import hashlib
+import libconf
+
+from instr_gen.cache import file_hash
+from instr_gen.writer import atomic_open
+
+# Directory of compiled mappings (None disables them), set by main
+cache_dir = None
+
+# Entry of mapping: { instr = "..."; icode = "..."; }
+ENTRY = re.compile(r'\{\s*instr\s*=\s*"([^"\\]*)"\s*;'
+                   r'\s*icode\s*=\s*"([^"\\]*)"\s*;\s*\}')
+
+# What is left of a mapping file once entries are removed
+SKELETON = re.compile(r'\s*instructions\s*=\s*\(\s*(?:,\s*)*\)\s*;\s*')
+
+# Version of compiled mappings, changing it invalidates them
+VERSION = 1
+
+
+# Parses mapping file with the generic libconfig parser
+def _parse_libconf(text: str) -> dict:
+    data = libconf.loads(text)
+    return dict((i['instr'], i['icode']) for i in data['instructions'])
+
+
+# Parses mapping file (instruction string -> icode). Files generated by
+# icode_gen are read with a single regex, anything else (comments, escaped
+# strings, other settings) falls back to libconf
+def read_mapping(path: str) -> dict:
+    with io.open(path) as f:
+        text = f.read()
+
+    entries = ENTRY.findall(text)
+    if not SKELETON.fullmatch(ENTRY.sub('', text)):
+        return _parse_libconf(text)
+
+    return dict(entries)
+
+
+# Returns path of compiled mapping of path
+def _compiled_path(path: str) -> str:
+    key = hashlib.blake2b(os.path.abspath(path).encode('utf-8'),
+                          digest_size = 16).hexdigest()
+    return os.path.join(cache_dir, f'icodes-{key}.marshal')
+
+
+def _save(path: str, data: dict) -> None:
+    os.makedirs(cache_dir, exist_ok = True)
+    with atomic_open(_compiled_path(path), 'wb') as f:
+        marshal.dump(data, f)
+
+
+def _load(path: str) -> dict:
+    try:
+        with open(_compiled_path(path), 'rb') as f:
+            data = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+    if not isinstance(data, dict) or data.get('version') != VERSION:
+        return None
+    return data
+
+
+# Loads mapping file, reusing its compiled (marshal) form from cache_dir
+# while the file is unchanged: same size and mtime, or else same hash
+def load_mapping(path: str) -> dict:
+    if cache_dir is None:
+        return read_mapping(path)
+
+    st = os.stat(path)
+    stat = [ st.st_size, st.st_mtime_ns ]
+
+    data = _load(path)
+    if data is not None and data['stat'] == stat:
+        return data['mapping']
+
+    digest = file_hash(path)
+    if data is None or data['hash'] != digest:
+        data = {
+            'version': VERSION,
+            'hash': digest,
+            'mapping': read_mapping(path)
+        }
+
+    data['stat'] = stat
+
+    # Compiled mappings are best-effort, the mapping is used even if unsaved
+    try:
+        _save(path, data)
+    except OSError as e:
+        print(f'WARNING: icode mapping not cached ({e})')
+
+    return data['mapping']
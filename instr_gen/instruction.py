@@ -1,38 +1,222 @@
-class Instruction:
-    def __init__(self, args, all_ports):
-        self.name  = args['name']
-        self.icode = args['icode']
-        self.extension = args['extension']
+import math
+import numpy as np
 
-        self.min_lat = args['min_lat']
-        self.max_lat = args['max_lat']
 
-        self.num_uops = args['num_uops']
+# Columnar storage of the instructions of an architecture. Scalar fields
+# are numpy arrays, port usage is an (instructions x ports) matrix with one
+# column for each port of config (in config's order)
+class InstructionTable:
+    def __init__(self, all_ports: list):
+        self.all_ports = list(all_ports)
+        self.port_index = dict((p, i) for i, p in enumerate(self.all_ports))
 
-        self.operands = self._parse_operands(self.name)
-        self.ports    = self._parse_ports(args['ports'], all_ports)
+        self.size = 0
+        self.names = []
+        self.icodes = []
 
+        # Extensions are stored as indices in extension_names
+        self.extension_names = []
+        self._extension_index = {}
+
+        self._min_lat   = np.empty(0, dtype = np.float64)
+        self._max_lat   = np.empty(0, dtype = np.float64)
+        self._num_uops  = np.empty(0, dtype = np.int32)
+        self._extension = np.empty(0, dtype = np.int16)
+        self._ports     = np.empty((0, len(self.all_ports)), dtype = np.int32)
+
+
+    def __len__(self) -> int:
+        return self.size
+
+
+    @property
+    def min_lat(self) -> np.ndarray:
+        return self._min_lat[:self.size]
+
+
+    @property
+    def max_lat(self) -> np.ndarray:
+        return self._max_lat[:self.size]
+
+
+    @property
+    def num_uops(self) -> np.ndarray:
+        return self._num_uops[:self.size]
+
+
+    @property
+    def extension(self) -> np.ndarray:
+        return self._extension[:self.size]
+
+
+    @property
+    def ports(self) -> np.ndarray:
+        return self._ports[:self.size]
 
-    # Gets operands from instructions's string
-    def _parse_operands(self, name: str) -> list:
-        x = name.split(' (')[-1]
-        if x[-1] == ')':
-            return x[:-1].split(', ')
-        return []
 
+    # Doubles capacity of arrays
+    def _grow(self) -> None:
+        cap = max(64, 2 * len(self._min_lat))
+        resize = lambda x: np.resize(x, (cap,) + x.shape[1:])
 
-    # Parse ports from string form to dict
-    def _parse_ports(self, ports_str: str, all_ports: list) -> dict:
-        ports = dict(map(lambda x: (x, 0), all_ports))
+        self._min_lat   = resize(self._min_lat)
+        self._max_lat   = resize(self._max_lat)
+        self._num_uops  = resize(self._num_uops)
+        self._extension = resize(self._extension)
+        self._ports     = resize(self._ports)
 
-        # Convert ports from uops.info notation to dict
-        if self.num_uops > 0:
+
+    # Adds instruction given parsed args, returns its view
+    def add(self, args: dict) -> "Instruction":
+        if self.size == len(self._min_lat):
+            self._grow()
+
+        i = self.size
+        self.size += 1
+
+        ext = args['extension']
+        if ext not in self._extension_index:
+            self._extension_index[ext] = len(self.extension_names)
+            self.extension_names.append(ext)
+
+        self.names.append(args['name'])
+        self.icodes.append(args['icode'])
+
+        self._min_lat[i]   = args['min_lat']
+        self._max_lat[i]   = args['max_lat']
+        self._num_uops[i]  = args['num_uops']
+        self._extension[i] = self._extension_index[ext]
+        self._ports[i]     = self._parse_ports(args['ports'], args['num_uops'])
+
+        return Instruction(self, i)
+
+
+    # Parse ports from uops.info notation (e.g. 1*p0156+2*p23) to a row
+    def _parse_ports(self, ports_str: str, num_uops: int) -> np.ndarray:
+        row = np.zeros(len(self.all_ports), dtype = np.int32)
+
+        if num_uops > 0:
             tmp = dict(map(
                 lambda x: tuple(x.split('*')[::-1]),
                 ports_str.split('+')
             ))
 
             for k, v in tmp.items():
-                ports[k] += int(v)
+                row[self.port_index[k]] += int(v)
+
+        return row
+
+
+    # Returns indices of instructions (which must be views of this table)
+    @staticmethod
+    def rows(instructions: list) -> np.ndarray:
+        return np.array([ i.index for i in instructions ], dtype = np.int64)
+
+
+    # Returns copy of port usage of rows, with the given ports set to zero
+    def port_matrix(self, rows: np.ndarray, zero_ports: list = []) -> np.ndarray:
+        matrix = self.ports[rows]
+        matrix[:, [ self.port_index[p] for p in zero_ports ]] = 0
+        return matrix
+
+
+    # Groups rows by port signature, a bitmask of the ports used (bit i is
+    # port i of config) once the given ports are set to zero. Returns list
+    # of distinct signatures and index of each row's signature in it
+    def port_signatures(self, rows: np.ndarray, zero_ports: list = []) -> (list, np.ndarray):
+        used = self.port_matrix(rows, zero_ports) > 0
+        unique, index = np.unique(used, axis = 0, return_inverse = True)
+
+        signatures = [
+            sum(1 << i for i in np.flatnonzero(u).tolist())
+            for u in unique
+        ]
+
+        return signatures, index.reshape(-1)
+
+
+    # Returns ports of signature (in config's order)
+    def signature_ports(self, signature: int) -> list:
+        return [ p for i, p in enumerate(self.all_ports) if signature >> i & 1 ]
+
+
+    # Converts array of latencies to list of ints (nan if unknown)
+    @staticmethod
+    def latencies(values: np.ndarray) -> list:
+        return [ Instruction._lat(x) for x in values.tolist() ]
+
+
+    # Returns most used port of each row of matrix (first one on ties,
+    # None if no port is used)
+    def argmax_ports(self, matrix: np.ndarray) -> list:
+        if matrix.shape[0] == 0:
+            return []
+
+        best = np.argmax(matrix, axis = 1)
+        used = matrix[np.arange(len(best)), best] > 0
+
+        return [
+            self.all_ports[b] if u else None
+            for b, u in zip(best.tolist(), used.tolist())
+        ]
+
+
+
+# Lightweight view of an instruction stored in InstructionTable
+class Instruction:
+    __slots__ = ('table', 'index')
+
+    def __init__(self, table: InstructionTable, index: int):
+        self.table = table
+        self.index = index
+
+
+    @property
+    def name(self) -> str:
+        return self.table.names[self.index]
+
+
+    @property
+    def icode(self) -> str:
+        return self.table.icodes[self.index]
+
+
+    @property
+    def extension(self) -> str:
+        return self.table.extension_names[self.table._extension[self.index]]
+
+
+    @property
+    def min_lat(self):
+        return self._lat(self.table._min_lat[self.index])
+
+
+    @property
+    def max_lat(self):
+        return self._lat(self.table._max_lat[self.index])
+
+
+    @property
+    def num_uops(self) -> int:
+        return int(self.table._num_uops[self.index])
+
+
+    # Gets operands from instructions's string
+    @property
+    def operands(self) -> list:
+        x = self.name.split(' (')[-1]
+        if x[-1] == ')':
+            return x[:-1].split(', ')
+        return []
+
+
+    # Port usage as dict (a copy, changing it does not change the table)
+    @property
+    def ports(self) -> dict:
+        row = self.table._ports[self.index].tolist()
+        return dict(zip(self.table.all_ports, row))
+
 
-        return ports
+    @staticmethod
+    def _lat(x: float):
+        return math.nan if math.isnan(x) else int(x)
@@ -1,8 +1,15 @@
+import io
+import os
+import libconf
 import argparse
+import functools
 
-from instr_gen.config import Config
-from instr_gen.parser import parse
+from instr_gen import counts, icode_mapping, parallel, profiling
+from instr_gen.cache import default_cache_dir, load_measurements
+from instr_gen.config import Config, InstructionGroup
+from instr_gen.parser import parse_all
 from instr_gen.result import Result
+from instr_gen.writer import atomic_open
 
 
 # Returns parser args
@@ -13,10 +20,9 @@ def parse_args() -> argparse.Namespace:
 
     parser.add_argument('--config',
         type = str,
-        action = 'store',
-        default = '',
-        required = True,
-        help = 'Libconfig file'
+        action = 'append',
+        default = [],
+        help = 'Libconfig file (may be repeated, one for each --name)'
     )
 
     parser.add_argument('--xml',
@@ -28,50 +34,259 @@ def parse_args() -> argparse.Namespace:
     )
 
     parser.add_argument('--icode',
+        type = str,
+        action = 'append',
+        default = [],
+        help = 'icode_mapping.cfg (once for all configs or once for each)'
+    )
+
+    parser.add_argument('--name',
+        type = str,
+        action = 'append',
+        default = [],
+        help = 'Prefix of resulting files (may be repeated)'
+    )
+
+    parser.add_argument('--manifest',
         type = str,
         action = 'store',
         default = '',
-        required = True,
-        help = 'icode_mapping.cfg'
+        help = 'Libconfig file listing runs (config, name and icode)'
     )
 
-    parser.add_argument('--name',
+    parser.add_argument('--sweep-uops',
         type = str,
         action = 'store',
         default = '',
-        required = True,
-        help = 'Prefix of resulting files'
+        help = 'Comma separated num_uops, files of each one are generated '
+               'from a single solve (prefixed by num_uops)'
+    )
+
+    parser.add_argument('--jobs',
+        type = int,
+        action = 'store',
+        default = 0,
+        help = 'Number of worker processes (default: one per core)'
+    )
+
+    parser.add_argument('--profile',
+        type = str,
+        action = 'store',
+        default = '',
+        help = 'JSON file to write time and memory used by each stage and '
+               'instruction group (and solver statistics)'
     )
 
-    return parser.parse_args()
+    parser.add_argument('--cache-dir',
+        type = str,
+        action = 'store',
+        default = default_cache_dir(),
+        help = 'Directory of cached xml measurements, counts and icode mappings'
+    )
+
+    parser.add_argument('--no-cache',
+        action = 'store_true',
+        help = 'Parse xml, counts and icode mappings directly, bypassing caches'
+    )
+
+    parser.add_argument('--rebuild-cache',
+        action = 'store_true',
+        help = 'Extract measurements from xml again, replacing cache'
+    )
+
+    args = parser.parse_args()
+    args.runs = get_runs(parser, args)
+
+    args.sweep = []
+    if args.sweep_uops != '':
+        try:
+            args.sweep = sorted(set(int(i) for i in args.sweep_uops.split(',')))
+        except ValueError:
+            parser.error('--sweep-uops must be a list of integers')
+
+        if args.sweep[0] <= 0:
+            parser.error('--sweep-uops must be positive')
+
+    return args
+
+
+# Returns list of (config, name, icode) to be generated, given either by
+# repeated --config/--name pairs or by a manifest file such as:
+#   runs = ( { config = "config_skl.cfg"; name = "skl"; icode = "..."; } );
+def get_runs(parser: argparse.ArgumentParser, args) -> list:
+    if args.manifest != '':
+        with io.open(args.manifest) as f:
+            manifest = libconf.load(f)
 
+        default_icode = args.icode[0] if len(args.icode) > 0 else None
+        runs = [
+            (i['config'], i['name'], i.get('icode', default_icode))
+            for i in manifest['runs']
+        ]
 
-# Gets result from all instruction groups
+        if any(icode is None for _, _, icode in runs):
+            parser.error('icode mapping missing in manifest (or --icode)')
+
+        return runs
+
+    if len(args.config) == 0 or len(args.config) != len(args.name):
+        parser.error('each --config must have a corresponding --name')
+
+    if len(args.icode) == 1:
+        icodes = args.icode * len(args.config)
+    elif len(args.icode) == len(args.config):
+        icodes = args.icode
+    else:
+        parser.error('--icode must be given once or once for each --config')
+
+    return list(zip(args.config, args.name, icodes))
+
+
+# Gets result from all instruction groups, groups are solved in parallel
+# and merged in order (output is the same as solving them serially)
 def solve_all(instr_groups) -> Result:
-    result = Result()
+    return solve_configs([ instr_groups ])[0]
+
+
+# Applies fn to instruction groups of every config in a single pool, yields
+# result of each group in order (stats of each group are given to profiler)
+def _map_groups(fn, groups_per_config: list, profiler = None):
+    groups = [ ig for instr_groups in groups_per_config for ig in instr_groups ]
+
+    enabled = profiler is not None and profiler.enabled
+    fn = profiling.measured(fn, enabled)
+
+    solved = iter(parallel.map_ordered(fn, groups))
+    for i, instr_groups in enumerate(groups_per_config):
+        for ig in instr_groups:
+            result, stats = next(solved)
+            if enabled:
+                profiler.add_group(i, ig.name, stats)
+
+            yield result
+
+
+# Solves instruction groups of every config in a single pool, returns list
+# with the merged result of each config
+def solve_configs(groups_per_config: list, profiler = None) -> list:
+    solved = _map_groups(InstructionGroup.solve, groups_per_config, profiler)
+
+    results = []
+    for instr_groups in groups_per_config:
+        results.append(Result())
+        for _ in instr_groups:
+            results[-1].merge(next(solved))
+
+    return results
+
+
+# Solves instruction groups of every config for each number of uops, returns
+# list with (dict num_uops -> Result, dict group -> (dict num_uops -> latency
+# error)) of each config
+def sweep_configs(groups_per_config: list, num_uops: list, profiler = None) -> list:
+    sweep = functools.partial(InstructionGroup.sweep, num_uops = num_uops)
+    solved = _map_groups(sweep, groups_per_config, profiler)
 
-    for ig in instr_groups:
-        tmp = ig.solve()
-        result.merge(tmp)
+    sweeps = []
+    for instr_groups in groups_per_config:
+        results = dict((k, Result()) for k in num_uops)
+        errors = {}
 
-    return result
+        for ig in instr_groups:
+            tmp, err = next(solved)
+            for k in num_uops:
+                results[k].merge(tmp[k])
+
+            if len(err) > 0:
+                errors[ig.name] = err
+
+        sweeps.append((results, errors))
+
+    return sweeps
+
+
+# Returns prefix of files of sweep's variant (e.g. out/skl -> out/10skl)
+def sweep_name(name: str, num_uops: int) -> str:
+    head, tail = os.path.split(name)
+    return os.path.join(head, f'{num_uops}{tail}')
+
+
+# Writes table of total latency error of each group for each num_uops.
+# Cells of num_uops a group can't be grouped into are left empty (and so
+# is the total of their row)
+def output_sweep_errors(name: str, errors: dict) -> None:
+    groups = list(errors.keys())
+    num_uops = sorted(set(k for err in errors.values() for k in err.keys()))
+
+    with atomic_open(name + '_sweep.csv') as f:
+        print(','.join([ 'num_uops' ] + groups + [ 'total' ]), file = f)
+
+        for k in num_uops:
+            row = [ errors[g].get(k) for g in groups ]
+            total = None if None in row else sum(row)
+
+            row = [ '' if i is None else f'{i:.0f}' for i in row + [ total ] ]
+            print(','.join([ str(k) ] + row), file = f)
 
 
 #####################
 def main() -> int:
     args = parse_args()
+    parallel.jobs = args.jobs
+    profiler = profiling.Profiler(enabled = args.profile != '')
+
+    if not args.no_cache:
+        counts.store.cache_dir = args.cache_dir
+        icode_mapping.cache_dir = args.cache_dir
 
     print('Parsing config file')
-    config = Config(args.config, args.icode)
+    configs, mappings = [], {}
+
+    # Icode mappings shared by configs are parsed only once
+    with profiler.stage('config'):
+        for cfg_path, _, icode_path in args.runs:
+            config = Config(cfg_path, icode_path, mappings.get(icode_path))
+            mappings[icode_path] = config.icode_mapping
+            configs.append(config)
 
     print('Parsing instructions xml')
-    instr_groups = parse(args.xml, config)
+    with profiler.stage('xml'):
+        table = None
+        if not args.no_cache:
+            archs = list(set(config.arch for config in configs))
+            table = load_measurements(args.xml, args.cache_dir,
+                                      archs, args.rebuild_cache)
+
+        parse_all(args.xml, configs, table)
 
     print('Generating results')
-    result = solve_all(instr_groups)
+    with profiler.stage('counts'):
+        for config in configs:
+            config.prepare()
+
+    instr_groups = [ config.instr_groups for config in configs ]
+    with profiler.stage('solve'):
+        if len(args.sweep) > 0:
+            sweeps = sweep_configs(instr_groups, args.sweep, profiler)
+        else:
+            results = solve_configs(instr_groups, profiler)
 
     print('Creating files')
-    result.output(args.name)
-    config.output_functional_units(args.name)
+    for i, (_, name, _) in enumerate(args.runs):
+        with profiler.stage('output', run = i):
+            if len(args.sweep) == 0:
+                results[i].output(name)
+                configs[i].output_functional_units(name)
+                continue
+
+            results, errors = sweeps[i]
+            for k in args.sweep:
+                results[k].output(sweep_name(name, k))
+                configs[i].output_functional_units(sweep_name(name, k))
+
+            output_sweep_errors(name, errors)
+
+    if profiler.enabled:
+        profiler.output(args.profile)
 
     return 0
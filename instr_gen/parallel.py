@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+import contextlib
+
+from concurrent.futures import ProcessPoolExecutor
+
+# Default number of worker processes (0 means one per core), set by main
+jobs = 0
+
+
+# Worker processes share the cores left by the pool, so tasks of a worker
+# may still use pools of their own (serially if there are none left)
+def _init_worker(worker_jobs: int) -> None:
+    global jobs
+    jobs = worker_jobs
+
+
+# Runs fn capturing everything it prints
+def _call_captured(fn, item) -> tuple:
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        res = fn(item)
+
+    return res, out.getvalue()
+
+
+# Returns number of processes allowed by num_jobs (jobs if None)
+def _total_jobs(num_jobs: int = None) -> int:
+    if num_jobs is None:
+        num_jobs = jobs
+    if num_jobs <= 0:
+        num_jobs = os.cpu_count() or 1
+
+    return num_jobs
+
+
+# Returns number of workers used for n tasks
+def num_workers(n: int, num_jobs: int = None) -> int:
+    return max(1, min(_total_jobs(num_jobs), n))
+
+
+# Applies fn to every item using a pool of processes, results are returned
+# in the same order of items. Output printed by workers is replayed in order
+# as well, so logs are the same as running serially (fn and items must be
+# picklable)
+def map_ordered(fn, items: list, num_jobs: int = None) -> list:
+    items = list(items)
+    workers = num_workers(len(items), num_jobs)
+
+    if workers == 1:
+        return [ fn(i) for i in items ]
+
+    worker_jobs = max(1, _total_jobs(num_jobs) // workers)
+
+    results = []
+    with ProcessPoolExecutor(workers, initializer = _init_worker,
+                             initargs = (worker_jobs,)) as pool:
+        futures = [ pool.submit(_call_captured, fn, i) for i in items ]
+
+        for fut in futures:
+            res, out = fut.result()
+            sys.stdout.write(out)
+            results.append(res)
+
+    return results
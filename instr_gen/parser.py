@@ -4,7 +4,6 @@ import xml.etree.ElementTree as ET
 from collections import defaultdict
 
 from instr_gen.config import Config
-from instr_gen.instruction import Instruction
 
 # Xml measurement names that contains latency values
 CYCLES = [
@@ -44,42 +43,115 @@ def parse_measurements(args: dict, arch_node) -> bool:
     return done
 
 
-# Parse instructions xml
-def parse(xml_path: str, config: Config) -> defaultdict:
-    root = ET.parse(xml_path)
-    icodes = {}
+# Yields instruction nodes as soon as they are completely read, the xml is
+# never fully loaded: each node is detached from the tree after being used,
+# so memory stays flat regardless of the xml size
+def iter_instruction_nodes(xml_path: str):
+    parents = []
 
-    for instr_node in root.iter('instruction'):
-        extension = instr_node.attrib['extension']
-        if not config.check_extension(extension):
+    for event, node in ET.iterparse(xml_path, events = ('start', 'end')):
+        if event == 'start':
+            parents.append(node)
             continue
 
-        # Args for the current instruction
-        args = {}
-        args['name'] = instr_node.attrib.get('string')
-        args['iform'] = instr_node.attrib.get('iform')
-        args['extension'] = extension
+        parents.pop()
+        if node.tag != 'instruction':
+            continue
 
-        ok = False
+        yield node
 
-        # Gets data from specified architecture
-        for arch_node in instr_node.iter('architecture'):
-            if arch_node.attrib.get('name', '-') == config.arch:
-                ok = ok or parse_measurements(args, arch_node)
+        node.clear()
+        if len(parents) > 0:
+            parents[-1].remove(node)
 
-        if not ok:
-            continue
 
-        if config.need_latency(extension) and math.isnan(args['min_lat']):
+# Parse measurements of every architecture of the instruction node (or only
+# the ones in archs), returns dict architecture -> args (the first node with
+# measurements is used)
+def parse_architectures(instr_node, archs = None) -> dict:
+    result = {}
+
+    for arch_node in instr_node.iterfind('architecture'):
+        name = arch_node.attrib.get('name', '-')
+        if name in result or (archs is not None and name not in archs):
             continue
 
-        args['icode'] = config.icode_mapping[args['name']]
+        args = {}
+        if parse_measurements(args, arch_node):
+            result[name] = args
+
+    return result
+
 
-        if args['icode'] in icodes:
+# Yields (arch, args) of instructions measured on the given architectures
+# (xml order), extensions not accepted by check_extension are skipped
+def iter_records(xml_path: str, archs, check_extension = None):
+    for instr_node in iter_instruction_nodes(xml_path):
+        extension = instr_node.attrib['extension']
+        if check_extension and not check_extension(extension):
             continue
-        icodes[args['icode']] = 1
 
-        instr = Instruction(args, config.ports)
-        config.add_instruction(instr)
+        measurements = parse_architectures(instr_node, archs)
+
+        for arch, measurement in measurements.items():
+            # Args for the current instruction
+            args = {}
+            args['name'] = instr_node.attrib.get('string')
+            args['iform'] = instr_node.attrib.get('iform')
+            args['extension'] = extension
+            args.update(measurement)
+
+            yield arch, args
+
+
+# Adds parsed instruction to config, unless it is filtered out
+def _add_instruction(args: dict, config: Config, icodes: dict) -> None:
+    extension = args['extension']
+    if not config.check_extension(extension):
+        return
+
+    if config.need_latency(extension) and math.isnan(args['min_lat']):
+        return
+
+    args = dict(args)
+    args['icode'] = config.icode_mapping[args['name']]
+
+    if args['icode'] in icodes:
+        return
+    icodes[args['icode']] = 1
+
+    instr = config.table.add(args)
+    config.add_instruction(instr)
+
+
+# Parse instructions xml for several configs at once, the xml (or its cached
+# measurements, if table is given) is read only once and each instruction is
+# sent to every config of its architecture. Returns list of instruction
+# groups of each config
+def parse_all(xml_path: str, configs: list, table = None) -> list:
+    by_arch = defaultdict(list)
+    for i, config in enumerate(configs):
+        by_arch[config.arch].append(i)
+
+    icodes = [ {} for _ in configs ]
+    check_extension = lambda x: any(c.check_extension(x) for c in configs)
+
+    if table is not None:
+        records = (
+            (arch, args)
+            for arch in by_arch.keys()
+            for args in table.records(arch, check_extension)
+        )
+    else:
+        records = iter_records(xml_path, set(by_arch.keys()), check_extension)
+
+    for arch, args in records:
+        for i in by_arch[arch]:
+            _add_instruction(args, configs[i], icodes[i])
+
+    return [ config.instr_groups for config in configs ]
+
 
-    return config.instr_groups
+# Parse instructions xml (or its cached measurements, if table is given)
+def parse(xml_path: str, config: Config, table = None) -> list:
+    return parse_all(xml_path, [config], table)[0]
@@ -0,0 +1,125 @@
+import os
+import json
+import time
+import resource
+import functools
+import contextlib
+import tracemalloc
+
+from instr_gen.writer import atomic_open
+
+# Peak traced memory seen by each enclosing measure (innermost last)
+_peaks = []
+
+
+# Returns peak resident set size of process (or of its finished children)
+def max_rss(who: int = resource.RUSAGE_SELF) -> int:
+    return resource.getrusage(who).ru_maxrss * 1024
+
+
+# Resets peak traced memory. tracemalloc.reset_peak needs Python 3.9, before
+# it tracing is restarted (blocks allocated so far are no longer traced)
+def _reset_peak() -> None:
+    if hasattr(tracemalloc, 'reset_peak'):
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.stop()
+        tracemalloc.start()
+
+
+# Measures wall time, CPU time and peak memory (traced by tracemalloc) of
+# the block, storing them into stats. Measures may be nested
+@contextlib.contextmanager
+def measure(stats: dict):
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+
+    # Peak of the enclosing block is saved before being reset
+    _, peak = tracemalloc.get_traced_memory()
+    if len(_peaks) > 0:
+        _peaks[-1] = max(_peaks[-1], peak)
+
+    _reset_peak()
+    _peaks.append(0)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    children = os.times()
+
+    try:
+        yield stats
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        peak = max(peak, _peaks.pop())
+        if len(_peaks) > 0:
+            _peaks[-1] = max(_peaks[-1], peak)
+
+        if started:
+            tracemalloc.stop()
+
+        stats['wall'] = time.perf_counter() - wall
+        stats['cpu'] = time.process_time() - cpu
+        stats['cpu_children'] = (
+            os.times().children_user - children.children_user +
+            os.times().children_system - children.children_system
+        )
+        stats['peak_traced'] = peak
+        stats['max_rss'] = max_rss()
+
+
+# Calls fn(group, ...) returning (result, stats), stats is None unless
+# enabled. Stats include those of the group's algorithm (group.stats)
+def _call_measured(fn, enabled: bool, group, *args, **kwargs) -> tuple:
+    if not enabled:
+        return fn(group, *args, **kwargs), None
+
+    stats = {}
+    with measure(stats):
+        result = fn(group, *args, **kwargs)
+
+    stats.update(group.stats)
+    return result, stats
+
+
+# Wraps fn (applied to instruction groups, possibly by worker processes)
+# so it returns (result, stats)
+def measured(fn, enabled: bool):
+    return functools.partial(_call_measured, fn, enabled)
+
+
+
+# Collects stats of every stage of the pipeline and of every instruction
+# group. Does nothing unless enabled
+class Profiler:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = []
+        self.groups = []
+
+
+    # Measures block as stage name (info is added to the stage's entry)
+    def stage(self, name: str, **info):
+        if not self.enabled:
+            return contextlib.nullcontext({})
+
+        self.stages.append(dict(name = name, **info))
+        return measure(self.stages[-1])
+
+
+    def add_group(self, run: str, group: str, stats: dict) -> None:
+        if self.enabled and stats is not None:
+            self.groups.append(dict(run = run, group = group, **stats))
+
+
+    # Writes JSON report
+    def output(self, path: str) -> None:
+        report = {
+            'stages': self.stages,
+            'groups': self.groups,
+            'max_rss': max_rss(),
+            'max_rss_children': max_rss(resource.RUSAGE_CHILDREN)
+        }
+
+        with atomic_open(path) as f:
+            json.dump(report, f, indent = 2)
+            f.write('\n')
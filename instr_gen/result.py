@@ -1,12 +1,56 @@
-# Resulting instruction
+from array import array
+
+from instr_gen.writer import atomic_open, write_list
+
+
+# Interned uop names, each name has an integer id
+class UopTable:
+    __slots__ = ('names', 'ids')
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+    # Returns id of name (a new one if not interned yet)
+    def intern(self, name: str) -> int:
+        uid = self.ids.get(name)
+        if uid is None:
+            uid = len(self.names)
+            self.ids[name] = uid
+            self.names.append(name)
+
+        return uid
+
+
+
+# Resulting instruction, uops are stored as ids of table
 class ResInstruction:
-    def __init__(self, icode: str):
-        self.uops = []
+    __slots__ = ('icode', 'uop_ids', 'table')
+
+    def __init__(self, icode: str, table: UopTable = None):
         self.icode = icode
+        self.uop_ids = array('i')
+        self.table = table if table is not None else UopTable()
 
 
     def add_uop(self, uop: str) -> None:
-        self.uops.append(uop)
+        self.uop_ids.append(self.table.intern(uop))
+
+
+    @property
+    def uops(self) -> list:
+        return [ self.table.names[i] for i in self.uop_ids ]
+
+
+    # Moves uop ids to another table (remap[i] is the new id of id i)
+    def _retable(self, table: UopTable, remap: list) -> None:
+        self.uop_ids = array('i', [ remap[i] for i in self.uop_ids ])
+        self.table = table
 
 
     def __str__(self):
@@ -20,6 +64,8 @@ class ResInstruction:
 
 # Resulting uop
 class ResUop:
+    __slots__ = ('name', 'latency', 'functional_unit', 'ports')
+
     def __init__(self, name: str, lat: int, fu: str, ports: str):
         self.name = name
         self.latency = lat
@@ -35,55 +81,89 @@ class ResUop:
 
 
 
+# Uops and instructions indexed by name and icode (the first one added
+# is kept). Uops of instructions are interned in uop_table
 class Result:
+    __slots__ = ('uop_table', '_uops', '_instructions')
+
     def __init__(self):
-        self.uops = []
-        self.instructions = []
+        self.uop_table = UopTable()
+
+        self._uops = {}
+        self._instructions = {}
+
+
+    @property
+    def uops(self) -> list:
+        return list(self._uops.values())
+
+
+    @property
+    def instructions(self) -> list:
+        return list(self._instructions.values())
+
+
+    # Returns instruction of icode (None if not in result)
+    def instruction(self, icode: str) -> ResInstruction:
+        return self._instructions.get(icode)
 
-        self.uop_tracker = {}
-        self.instr_tracker = {}
 
+    # Returns uop named name (None if not in result)
+    def uop(self, name: str) -> ResUop:
+        return self._uops.get(name)
 
-    def add_instruction(self, instr: ResInstruction) -> None:
-        if instr.icode in self.instr_tracker:
+
+    # Instructions of other tables have their uop ids remapped to uop_table
+    # (remaps holds the mapping of each table already seen)
+    def add_instruction(self, instr: ResInstruction, remaps: dict = None) -> None:
+        if instr.icode in self._instructions:
             return
 
-        self.instr_tracker[instr.icode] = 1
-        self.instructions.append(instr)
+        if instr.table is not self.uop_table:
+            if remaps is None:
+                remaps = {}
+
+            key = id(instr.table)
+            if key not in remaps:
+                remaps[key] = [ self.uop_table.intern(i) for i in instr.table.names ]
+
+            instr._retable(self.uop_table, remaps[key])
+
+        self._instructions[instr.icode] = instr
 
 
     def add_uop(self, uop: ResUop) -> None:
-        if uop.name in self.uop_tracker:
+        if uop.name in self._uops:
             return
-            
-        self.uop_tracker[uop.name] = 1
-        self.uops.append(uop)
+
+        self._uops[uop.name] = uop
 
 
     def merge(self, other: "Result") -> None:
-        for uop in other.uops:
+        for uop in other._uops.values():
             self.add_uop(uop)
 
-        for instr in other.instructions:
-            self.add_instruction(instr)
+        remaps = {}
+        for instr in other._instructions.values():
+            self.add_instruction(instr, remaps)
 
 
-    def output(self, name: str) -> None:
-        self.uops.sort(key = lambda x: x.name)
-        self.instructions.sort(key = lambda x: x.icode)
+    # Writes instructions (sorted by icode) to text file f
+    def write_instructions(self, f) -> None:
+        instrs = self._instructions
+        write_list(f, 'INSTRUCTIONS', (instrs[k] for k in sorted(instrs)))
 
-        # Output instructions
-        with open(name + '_instructions.cfg', 'w+') as f:
-            lines = [ f'\t{{ {str(i)} }}' for i in self.instructions ]
 
-            print('INSTRUCTIONS = (', file = f)
-            print(',\n'.join(lines), file = f)
-            print(');', file = f)
+    # Writes uops (sorted by name) to text file f
+    def write_uops(self, f) -> None:
+        uops = self._uops
+        write_list(f, 'UOPS', (uops[k] for k in sorted(uops)))
 
-        # Output uops
-        with open(name + '_uops.cfg', 'w+') as f:
-            lines = [ f'\t{{ {str(i)} }}' for i in self.uops ]
 
-            print('UOPS = (', file = f)
-            print(',\n'.join(lines), file = f)
-            print(');', file = f)
+    # Writes instructions and uops files
+    def output(self, name: str) -> None:
+        with atomic_open(name + '_instructions.cfg') as f:
+            self.write_instructions(f)
+
+        with atomic_open(name + '_uops.cfg') as f:
+            self.write_uops(f)
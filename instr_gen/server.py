@@ -0,0 +1,326 @@
+import io
+import os
+import json
+import stat
+import signal
+import hashlib
+import libconf
+import argparse
+import threading
+import socketserver
+
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from instr_gen import api, counts, icode_mapping, parallel
+from instr_gen.cache import default_cache_dir, load_measurements
+
+# Generation daemon: instructions.xml, icode mapping and counts are loaded
+# once and kept in memory, configs are sent by clients, e.g.:
+#
+#   python -m instr_gen.server --xml instructions.xml --icode mapping.cfg
+#   curl --data-binary @config_skl.cfg http://127.0.0.1:8723/generate
+#   curl -H 'Content-Type: application/json' --data-binary @config.json \
+#        --unix-socket /tmp/instr_gen.sock http://localhost/generate
+#
+# Configs are libconfig text (or json, given its content type). Responses
+# are json objects with the contents of instructions, uops and functional
+# units files. GET /status returns loaded inputs and cache usage
+
+
+# Returns parser args
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description = 'Serve instruction generation for OrCS'
+    )
+
+    parser.add_argument('--xml',
+        type = str,
+        action = 'store',
+        default = '',
+        required = True,
+        help = 'instructions.xml (uops.info)'
+    )
+
+    parser.add_argument('--icode',
+        type = str,
+        action = 'store',
+        default = '',
+        required = True,
+        help = 'icode_mapping.cfg'
+    )
+
+    parser.add_argument('--arch',
+        type = str,
+        action = 'append',
+        default = [],
+        help = 'Architecture kept in memory (may be repeated, default: all)'
+    )
+
+    parser.add_argument('--host',
+        type = str,
+        action = 'store',
+        default = '127.0.0.1',
+        help = 'Address to listen on'
+    )
+
+    parser.add_argument('--port',
+        type = int,
+        action = 'store',
+        default = 8723,
+        help = 'TCP port to listen on'
+    )
+
+    parser.add_argument('--socket',
+        type = str,
+        action = 'store',
+        default = '',
+        help = 'Unix socket to listen on (instead of TCP)'
+    )
+
+    parser.add_argument('--results',
+        type = int,
+        action = 'store',
+        default = 32,
+        help = 'Number of recent results kept in memory'
+    )
+
+    parser.add_argument('--jobs',
+        type = int,
+        action = 'store',
+        default = 1,
+        help = 'Number of worker processes of each request (default: 1)'
+    )
+
+    parser.add_argument('--cache-dir',
+        type = str,
+        action = 'store',
+        default = default_cache_dir(),
+        help = 'Directory of cached xml measurements, counts and icode mappings'
+    )
+
+    parser.add_argument('--no-cache',
+        action = 'store_true',
+        help = 'Parse xml, counts and icode mappings directly, bypassing caches'
+    )
+
+    return parser.parse_args()
+
+
+
+# Raised for requests whose config cannot be used
+class RequestError(Exception):
+    pass
+
+
+
+# Inputs shared by every request and cache of recent results
+class Generator:
+    def __init__(self, table, mapping: dict, max_results: int, jobs: int):
+        self.table = table
+        self.mapping = mapping
+        self.max_results = max_results
+        self.jobs = jobs
+
+        self.results = OrderedDict()
+        self.hits, self.misses = 0, 0
+        self.lock = threading.Lock()
+
+
+    # Loads config document, json or libconfig text
+    @staticmethod
+    def _load_config(body: bytes, content_type: str) -> dict:
+        try:
+            text = body.decode('utf-8')
+            if content_type.startswith('application/json'):
+                return json.loads(text)
+
+            return libconf.loads(text)
+        except (UnicodeDecodeError, ValueError, libconf.ConfigParseError) as e:
+            raise RequestError(f'invalid config: {e}')
+
+
+    # Returns signature of each counts directory used by config's groups
+    @staticmethod
+    def _counts_signatures(config) -> dict:
+        paths = set(
+            str(ig.algorithm.config.params['counts_path'])
+            for ig in config.instr_groups
+            if 'counts_path' in ig.algorithm.config.params
+        )
+
+        return dict((p, counts.dir_signature(p)) for p in paths)
+
+
+    # Whether counts directories are still as they were when signed
+    @staticmethod
+    def _counts_unchanged(signatures: dict) -> bool:
+        try:
+            return all(counts.dir_signature(p) == s for p, s in signatures.items())
+        except OSError:
+            return False
+
+
+    # Returns generated files of config (as json bytes) and signatures of
+    # the counts it used (taken before solving)
+    def _generate(self, data: dict) -> (bytes, dict):
+        try:
+            config = api.load_config(data, self.mapping)
+            signatures = self._counts_signatures(config)
+        except (KeyError, TypeError, AssertionError, OSError) as e:
+            raise RequestError(f'invalid config: {e!r}')
+
+        result = api.generate(config, self.table, jobs = self.jobs)
+
+        files = {}
+        for key, write in [
+            ('instructions', result.write_instructions),
+            ('uops', result.write_uops),
+            ('functional_units', config.write_functional_units)
+        ]:
+            f = io.StringIO()
+            write(f)
+            files[key] = f.getvalue()
+
+        return json.dumps(files).encode('utf-8'), signatures
+
+
+    # Returns response of config, generating it unless it's a recent one
+    # whose benchmark counts are unchanged
+    def generate(self, body: bytes, content_type: str) -> bytes:
+        key = hashlib.blake2b(content_type.encode('utf-8') + b'\0' + body,
+                              digest_size = 16).digest()
+
+        with self.lock:
+            if key in self.results:
+                response, signatures = self.results[key]
+                if self._counts_unchanged(signatures):
+                    self.hits += 1
+                    self.results.move_to_end(key)
+                    return response
+
+                del self.results[key]
+
+            self.misses += 1
+            response, signatures = self._generate(self._load_config(body, content_type))
+
+            self.results[key] = (response, signatures)
+            if len(self.results) > self.max_results:
+                self.results.popitem(last = False)
+
+            return response
+
+
+    def status(self) -> dict:
+        return {
+            'archs': list(self.table.archs.keys()),
+            'instructions': len(self.table.instructions['name']),
+            'icodes': len(self.mapping),
+            'results': len(self.results),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+
+class Handler(BaseHTTPRequestHandler):
+    def _reply(self, code: int, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def _error(self, code: int, message: str) -> None:
+        self._reply(code, json.dumps({ 'error': message }).encode('utf-8'))
+
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self._error(404, f'unknown path {self.path}')
+
+        self._reply(200, json.dumps(self.server.generator.status()).encode('utf-8'))
+
+
+    def do_POST(self):
+        if self.path != '/generate':
+            return self._error(404, f'unknown path {self.path}')
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        content_type = self.headers.get('Content-Type', '')
+
+        try:
+            response = self.server.generator.generate(body, content_type)
+        except RequestError as e:
+            return self._error(400, str(e))
+        except Exception as e:
+            return self._error(500, f'{type(e).__name__}: {e}')
+
+        self._reply(200, response)
+
+
+    # Unix socket clients have no address
+    def address_string(self) -> str:
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return 'local'
+
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    pass
+
+
+
+#####################
+def main() -> int:
+    args = parse_args()
+    parallel.jobs = args.jobs
+    archs = args.arch if len(args.arch) > 0 else None
+
+    print('Loading icode mapping')
+    if not args.no_cache:
+        counts.store.cache_dir = args.cache_dir
+        icode_mapping.cache_dir = args.cache_dir
+    mapping = icode_mapping.load_mapping(args.icode)
+
+    print('Loading instructions xml')
+    if args.no_cache:
+        table = api.load_instructions(args.xml, archs)
+    else:
+        table = load_measurements(args.xml, args.cache_dir, archs)
+
+    # Counts are read by the first request using them, then kept by store
+    generator = Generator(table, mapping, args.results, args.jobs)
+
+    if args.socket != '':
+        # A socket left by a previous server is replaced
+        if os.path.exists(args.socket) and stat.S_ISSOCK(os.stat(args.socket).st_mode):
+            os.unlink(args.socket)
+        server = UnixHTTPServer(args.socket, Handler)
+        print(f'Listening on {args.socket}')
+    else:
+        server = HTTPServer((args.host, args.port), Handler)
+        print(f'Listening on http://{args.host}:{server.server_port}')
+
+    server.generator = generator
+
+    # Socket is removed on termination as well
+    signal.signal(signal.SIGTERM, lambda *_: exit(0))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket != '':
+            os.unlink(args.socket)
+
+    return 0
+
+
+if __name__ == '__main__':
+    exit(main())
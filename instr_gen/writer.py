@@ -0,0 +1,54 @@
+import os
+import secrets
+import contextlib
+
+# Size of the buffer of output files
+BUFFER_SIZE = 1 << 20
+
+
+# Creates a new temporary file next to path, returns (fd, name). The file
+# is created with the permissions open() would give it (the kernel applies
+# the current umask to mode 0o666)
+def _create_temp(path: str) -> tuple:
+    directory, base = os.path.split(path)
+
+    while True:
+        tmp = os.path.join(directory, f'.{base}.{secrets.token_hex(4)}.tmp')
+        try:
+            return os.open(tmp, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666), tmp
+        except FileExistsError:
+            continue
+
+
+# Opens file for writing through a temporary file in the same directory,
+# which replaces path only if the block finishes (a crash never leaves a
+# half-written file behind)
+@contextlib.contextmanager
+def atomic_open(path: str, mode: str = 'w'):
+    fd, tmp = _create_temp(path)
+    try:
+        try:
+            f = os.fdopen(fd, mode, buffering = BUFFER_SIZE)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        with f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+# Streams libconfig list of records (e.g. NAME = ( { ... }, { ... } );)
+# to file, one record at a time
+def write_list(f, name: str, records) -> None:
+    f.write(f'{name} = (\n')
+
+    sep = ''
+    for record in records:
+        f.write(f'{sep}\t{{ {record} }}')
+        sep = ',\n'
+
+    f.write('\n);\n')